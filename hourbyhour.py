@@ -1,7 +1,5 @@
 import streamlit as st
-import pandas as pd
-import re
-from utils import sidebar, columnnames
+from utils import sidebar, columnnames, hourcore, resultcache, loaddata
 
 def set_session_state():
     if 'new_column_names' not in st.session_state:
@@ -16,17 +14,17 @@ def set_session_state():
     if "selected_file" not in st.session_state:
         st.session_state.selected_file = None
 
-# Function to apply to each row
-def find_divisible_in_range(value, min_range=100, max_range=200):
-    divisors = [1, 2, 3]
-    for divisor in divisors:
-        result = round(value / divisor)
-        if min_range <= result <= max_range:
-            return result
-    return None
+@st.cache_resource(max_entries=4)
+def prepare_time_frame(_df, key):
+    # parse and sort by time once per cleaned frame, reruns with other filters reuse it.
+    # Cached by key (the upload, its format and the cleaning settings) instead of hashing the frame.
+    # The frame is shared, not copied, between reruns and must not be modified.
+    df, time_offsets = hourcore.index_by_time(_df)
+    return resultcache.read_only(df), time_offsets
 
 
 def main():
+    loaddata.use_copy_on_write()
     set_session_state()
 
     st.set_page_config(
@@ -82,20 +80,27 @@ def main():
         if st.session_state.new_column_names:
             df.columns = st.session_state.new_column_names
 
-        # Define the pattern to match 'checkpoint' followed by an optional space and a letter
-        pattern = r"checkpoint\s*([A-Z])"
+        # every 'Checkpoint * Sum In Flow' column in the file is processed in the same pass
+        all_checkpoint_columns = hourcore.checkpoint_columns(df.columns)
+        checkpoint_columns = st.multiselect('Select checkpoints:', all_checkpoint_columns, default=all_checkpoint_columns,
+                                            format_func=hourcore.flow_name, key='checkpoints')
 
-        # Search for the pattern in the filename (case-insensitive)
-        match = re.search(pattern, st.session_state.selected_file.name, re.IGNORECASE)
+        if len(checkpoint_columns) == 0 or hourcore.PRECHECK_COLUMN not in df.columns:
+            st.warning(f':warning: The file needs `{hourcore.PRECHECK_COLUMN}` and at least one `Checkpoint * Sum In Flow` column')
+            st.stop()
 
-        if match:
-            # Extract the letter (A, B, C, etc.)
-            letter = match.group(1).upper()  # Use .upper() to ensure consistency
-            checkpoint = f'Checkpoint {letter}'
-        else:
-            checkpoint = st.radio('Select a checkpoint:', [
-                'Checkpoint A', 'Checkpoint B', 'Checkpoint COMBINED'
-            ], index=None, key='checkpoint')
+        flow_columns = checkpoint_columns + [hourcore.PRECHECK_COLUMN]
+
+        approxCol1, approxCol2 = st.columns(2)
+        relative_accuracy = None
+        with approxCol1:
+            approximate = st.toggle('Approximate percentiles', value=False, key='approximate',
+                                    help='Estimate percentiles from compact quantile sketches built in one pass instead of sorting the values')
+        with approxCol2:
+            if approximate:
+                relative_accuracy = st.select_slider('Maximum relative error:', [0.005, 0.01, 0.02, 0.05], value=0.01,
+                                                     format_func=lambda a: f'±{a:.1%}', key='relative_accuracy')
+        approximate_note = f'Approximate percentiles: within ±{relative_accuracy:.1%} of the exact values.' if approximate else None
 
         tempColNeg1, tempColNeg2 = st.columns(2)
 
@@ -104,10 +109,9 @@ def main():
         
         with tempColNeg2:
             if removeNegativeValues:
-                # turn negative values to 0 from f'{checkpoint} Sum In Flow' and 'Precheck Sum In Flow' and count the number of negative values
-                negative_values = df[(df[f'{checkpoint} Sum In Flow'] < 0) | (df['Precheck Sum In Flow'] < 0)].shape[0]
-                df[f'{checkpoint} Sum In Flow'] = df[f'{checkpoint} Sum In Flow'].apply(lambda x: 0 if x < 0 else x)
-                df['Precheck Sum In Flow'] = df['Precheck Sum In Flow'].apply(lambda x: 0 if x < 0 else x)
+                # turn negative values to 0 in all flow columns and count the number of rows with negative values
+                negative_values = hourcore.count_negative_rows(df, flow_columns)
+                df[flow_columns] = df[flow_columns].clip(lower=0)
                 st.write(f'Number of negative values removed: `{negative_values}`')
 
         boundsFor4Standard, startBoundsFor4Standard = st.columns(2)
@@ -138,34 +142,18 @@ def main():
             
         # Ensure that precheck_bounds and standard_bound variables exist and have valid values
         if standard_bounds and standard_bound[0] > 0:
-            df[f'{checkpoint} Sum In Flow'] = df[f'{checkpoint} Sum In Flow'].apply(find_divisible_in_range, args=(standard_bound[0], standard_bound[1]))
-            df_std = df.copy().dropna().reset_index(drop=True)
+            df[checkpoint_columns] = hourcore.fit_to_range(df[checkpoint_columns], standard_bound[0], standard_bound[1])
+            # rows with at least one checkpoint in range; a checkpoint out of range stays NaN in its own column
+            df_std = sidebar.track('standard bounds', df.dropna(subset=checkpoint_columns, how='all').reset_index(drop=True))
             st.dataframe(df_std, use_container_width=True)
 
             showStatsStandard = st.checkbox('Show Standard Stats', value=False)
 
             if showStatsStandard:
-                # get average, 80th percentile, 90th percentile, 95th percentile, 99th percentile
-                standard_avg = df_std[f'{checkpoint} Sum In Flow'].mean()
-                standard_60th = df_std[f'{checkpoint} Sum In Flow'].quantile(0.6)
-                standard_70th = df_std[f'{checkpoint} Sum In Flow'].quantile(0.7)
-                standard_75th = df_std[f'{checkpoint} Sum In Flow'].quantile(0.75)
-                standard_80th = df_std[f'{checkpoint} Sum In Flow'].quantile(0.8)
-                standard_90th = df_std[f'{checkpoint} Sum In Flow'].quantile(0.9)
-                standard_95th = df_std[f'{checkpoint} Sum In Flow'].quantile(0.95)
-                standard_99th = df_std[f'{checkpoint} Sum In Flow'].quantile(0.99)
-
-                # write it table format
-                st.dataframe(pd.DataFrame({
-                    'Standard Average': [standard_avg],
-                    '60th': [standard_60th],
-                    '70th': [standard_70th],
-                    '75th': [standard_75th],
-                    '80th': [standard_80th],
-                    '90th': [standard_90th],
-                    '95th': [standard_95th],
-                    '99th': [standard_99th]
-                }), use_container_width=True)
+                # get average and percentiles of every checkpoint in table format, each from its own in-range values
+                st.dataframe(hourcore.flow_stats(df, checkpoint_columns, relative_accuracy), use_container_width=True)
+                if approximate_note:
+                    st.caption(approximate_note)
         
         boundsFor4Precheck, startBoundsFor4Precheck = st.columns(2)
         with boundsFor4Precheck:
@@ -193,46 +181,51 @@ def main():
                         </p>''', unsafe_allow_html=True)
                 
         if precheck_bounds and precheck_bound[0] > 0:
-            df['Precheck Sum In Flow'] = df['Precheck Sum In Flow'].apply(find_divisible_in_range, args=(precheck_bound[0], precheck_bound[1]))
-            df_pre = df.copy().dropna().reset_index(drop=True)
+            df[[hourcore.PRECHECK_COLUMN]] = hourcore.fit_to_range(df[[hourcore.PRECHECK_COLUMN]], precheck_bound[0], precheck_bound[1])
+            df_pre = sidebar.track('precheck bounds', df.dropna(subset=[hourcore.PRECHECK_COLUMN]).reset_index(drop=True))
             st.dataframe(df_pre, use_container_width=True)
 
             showStatsPrecheck = st.checkbox('Show Precheck Stats (percentiles)', value=False)
 
             if showStatsPrecheck:
-                # get average, 80th percentile, 90th percentile, 95th percentile, 99th percentile
-                precheck_avg = df_pre['Precheck Sum In Flow'].mean()
-                precheck_60th = df_pre['Precheck Sum In Flow'].quantile(0.6)
-                precheck_70th = df_pre['Precheck Sum In Flow'].quantile(0.7)
-                precheck_75th = df_pre['Precheck Sum In Flow'].quantile(0.75)
-                precheck_80th = df_pre['Precheck Sum In Flow'].quantile(0.8)
-                precheck_90th = df_pre['Precheck Sum In Flow'].quantile(0.9)
-                precheck_95th = df_pre['Precheck Sum In Flow'].quantile(0.95)
-                precheck_99th = df_pre['Precheck Sum In Flow'].quantile(0.99)
-                
-                # write it table format
-                st.dataframe(pd.DataFrame({
-                    'Precheck Average': [precheck_avg],
-                    '60th': [precheck_60th],
-                    '70th': [precheck_70th],
-                    '75th': [precheck_75th],
-                    '80th': [precheck_80th],
-                    '90th': [precheck_90th],
-                    '95th': [precheck_95th],
-                    '99th': [precheck_99th]
-                }), use_container_width=True)
-
-        # convert df['Time'] to datetime object
-        df['Time'] = pd.to_datetime(df['Time'], format='%m/%d/%Y %H:%M')
-
-        tableElement.dataframe(df, use_container_width=True)
-
-        df['Hour'] = df['Time'].dt.hour
-        df['Month'] = df['Time'].dt.month
-        df['Day'] = df['Time'].dt.day
-        df['Year'] = df['Time'].dt.year
-        df['Quarter'] = df['Time'].dt.quarter
-        df['Date'] = df['Time'].dt.date
+                # get average and percentiles in table format, independent of the checkpoints' bounds
+                st.dataframe(hourcore.flow_stats(df, [hourcore.PRECHECK_COLUMN], relative_accuracy), use_container_width=True)
+                if approximate_note:
+                    st.caption(approximate_note)
+
+        # convert df['Time'] to datetime, sort by it and add the Hour, Month, Day, Year, Quarter and Date columns
+        cleaning = (tuple(checkpoint_columns), removeNegativeValues,
+                    standard_bound if standard_bounds and standard_bound[0] > 0 else None,
+                    precheck_bound if precheck_bounds and precheck_bound[0] > 0 else None)
+        df, time_offsets = prepare_time_frame(df, (loaddata.file_key(st.session_state.selected_file),
+                                                   st.session_state.selected_format, tuple(df.columns), cleaning))
+        sidebar.track('time indexed', df)
+
+        tableElement.dataframe(df, use_container_width=True, hide_index=True)
+
+        st.write('## Peak rolling hour per day')
+        showDailyPeaks = st.toggle('Show the busiest window of every day', value=False, key='showDailyPeaks',
+                                   help='Sliding windows start at every reading, so a peak from 7:30 to 8:30 is found too')
+        if showDailyPeaks:
+            dailyCol1, dailyCol2 = st.columns(2)
+            with dailyCol1:
+                peak_window = st.select_slider('Window (minutes):', [15, 30, 60, 90, 120], value=60, key='peak_window')
+            with dailyCol2:
+                first_date, last_date = df['Time'].min().date(), df['Time'].max().date()
+                peak_dates = st.date_input('Date range:', (first_date, last_date), min_value=first_date, max_value=last_date,
+                                           key='peak_dates')
+            try:
+                daily_peaks = resultcache.cached_call(hourcore.daily_peaks, df, ['Time'] + flow_columns, columns=flow_columns,
+                                                      window=peak_window)
+            except ValueError as e:
+                st.warning(f':warning: {e}')
+            else:
+                if len(peak_dates) == 2:
+                    dates = daily_peaks['Date'].dt.date
+                    daily_peaks = daily_peaks[(dates >= peak_dates[0]) & (dates <= peak_dates[1])]
+                st.dataframe(hourcore.daily_peak_percentiles(daily_peaks), use_container_width=True)
+                st.dataframe(daily_peaks, use_container_width=True, hide_index=True)
+                sidebar.download_table(daily_peaks, 'daily_peaks', key='exportDailyPeaks', index=False)
 
         st.write('## Select the columns to perform operations...')
 
@@ -250,24 +243,29 @@ def main():
 
         with tempcol3:
             # which kind of operation to perform
-            operation = st.selectbox('Select operation:', ['Mean', 'Max', 'PERCENTILE'], index=None)
+            # Multiple computes several statistics and percentiles in one pass
+            operation = st.selectbox('Select operation:', ['Mean', 'Max', 'PERCENTILE', 'Multiple'], index=None)
 
         with tempcol5:
             if groupby is not None and 'Date' in groupby:
                 with tempcol2:
-                    # radio to select month (year)
-                    df['Date'] = pd.to_datetime(df['Date'])
-                    month_year = df['Date'].dt.strftime('%b-%y').unique()
+                    # radio to select month (year), months come from the precomputed month offsets
+                    month_periods = time_offsets['month'].index
+                    month_year = list(month_periods.strftime('%b-%y'))
                     selected_month_year_range = st.select_slider(
                         'Select a range of month-year:',
                         options=month_year,
-                        value=(month_year[2], month_year[5]),
+                        value=(month_year[min(2, len(month_year) - 1)], month_year[min(5, len(month_year) - 1)]),
                         key='selected_month_year_range'
                     )
                         
         with tempcol4:
             if operation is not None and 'percentile' in operation.lower():
                 quantileQ = st.slider('Select PERCENTILE value:', 0.0, 1.0, 0.75, 0.05)      
+            if operation == 'Multiple':
+                metrics = st.multiselect('Select statistics:', hourcore.METRICS, default=['Mean', 'Max'])
+                quantiles = st.multiselect('Select PERCENTILE values:', [0.5] + hourcore.STATS_QUANTILES, default=[0.75, 0.9, 0.95],
+                                           format_func=hourcore.quantile_label)
 
         if groupby is not None and len(groupby) > 0:
             if 'Hour' in groupby:
@@ -286,34 +284,51 @@ def main():
                     datevalues = st.slider('Select a range of dates', 1, 31, (1, 15))
         
         # select columns to perform operations
-        columnsToPerformOps = st.multiselect('Select column(s) to perform operations:', df.columns, default=[])
+        columnsToPerformOps = st.multiselect('Select column(s) to perform operations:', df.columns, default=flow_columns)
 
 
         if groupby is not None and operation is not None and len(columnsToPerformOps) > 0:
-            # if groupby hour? then
+            # ranges of hours, months and dates selected, applied below as one mask
+            ranges = {}
+
             if 'Hour' in groupby:
-                # filter the dataframe based on the range of hours selected
-                df = df[(df['Hour'] >= hoursvalues[0]) & (df['Hour'] <= hoursvalues[1])].copy()
+                ranges['Hour'] = hoursvalues
 
             if 'Month' in groupby:
-                # filter the dataframe based on the range of months selected
-                df = df[(df['Month'] >= monthvalues[0]) & (df['Month'] <= monthvalues[1])].copy()
+                ranges['Month'] = monthvalues
 
             if 'Date' in groupby:
-                # filter the dataframe based on the range of dates selected
-                # filter over months and dates
-                print(len(df))
-                selected_month_year_range = pd.to_datetime(selected_month_year_range, format='%b-%y')
-                df = df[(df['Date'] >= selected_month_year_range[0]) & (df['Date'] <= selected_month_year_range[1])].copy()
-                print(len(df))
-                df = df[(df['Day'] >= datevalues[0]) & (df['Day'] <= datevalues[1])].copy()
-                print(len(df))
-
-            # perform operations on the selected columns
-            if operation.lower() == 'percentile':
-                filtered_df = df.groupby(groupby)[columnsToPerformOps].quantile(quantileQ).round(0)
+                # filter over months with a binary-search slice of the sorted time index,
+                # from the first selected month up to and including the first day of the last one
+                first_month, last_month = (month_periods[month_year.index(label)] for label in selected_month_year_range)
+                df = hourcore.slice_periods(df, time_offsets['day'], first_month.asfreq('D', 'start'), last_month.asfreq('D', 'start') + 1)
+                ranges['Day'] = datevalues
+
+            if len(ranges) > 0:
+                df = df[hourcore.range_mask(df, ranges)]
+            sidebar.track('filtered', df)
+
+            # perform operations on the selected columns, reusing the result of an earlier identical request
+            if operation == 'Multiple':
+                if len(metrics) + len(quantiles) == 0:
+                    st.warning(':warning: Please select at least one statistic or percentile')
+                    st.stop()
+                statistics_df = resultcache.cached_call(hourcore.aggregate_many, df, [groupby] + columnsToPerformOps,
+                                                        groupby=groupby, columns=columnsToPerformOps, metrics=metrics,
+                                                        quantiles=sorted(quantiles), relative_accuracy=relative_accuracy)
+                st.dataframe(statistics_df, use_container_width=True)
+                if approximate_note and quantiles:
+                    st.caption(approximate_note)
+                sidebar.download_table(statistics_df, 'hour_by_hour_statistics', key='exportStatistics')
+
+                # the split and lanes below use one of the statistics
+                statistic = st.selectbox('Statistic for the split and lanes:', list(statistics_df.columns.unique('Statistic')))
+                filtered_df = statistics_df.xs(statistic, axis=1, level='Statistic')
             else:
-                filtered_df = df.groupby(groupby)[columnsToPerformOps].agg(operation.lower()).round(0)
+                filtered_df = resultcache.cached_call(hourcore.aggregate, df, [groupby] + columnsToPerformOps,
+                                                      groupby=groupby, columns=columnsToPerformOps, operation=operation,
+                                                      quantile=quantileQ if operation.lower() == 'percentile' else None,
+                                                      relative_accuracy=relative_accuracy if operation.lower() == 'percentile' else None)
 
             showTable1, showGraph1 = st.columns(2)
 
@@ -328,15 +343,18 @@ def main():
                 st.bar_chart(filtered_df.iloc[:, :3], use_container_width=True, stack=False)
 
             if showTable1Checkbox:
-                if 'Precheck Sum In Flow' in filtered_df.columns and f'{checkpoint} Sum In Flow' in filtered_df.columns:
-                    # get % of the total sum
-                    filtered_df['Precheck %'] = (filtered_df['Precheck Sum In Flow'] / (filtered_df['Precheck Sum In Flow'] + filtered_df[f'{checkpoint} Sum In Flow'])) * 100
-                    filtered_df[f'{checkpoint} %'] = (filtered_df[f'{checkpoint} Sum In Flow'] / (filtered_df['Precheck Sum In Flow'] + filtered_df[f'{checkpoint} Sum In Flow'])) * 100
+                split_checkpoints = [column for column in checkpoint_columns if column in filtered_df.columns]
+                if hourcore.PRECHECK_COLUMN in filtered_df.columns and len(split_checkpoints) > 0:
+                    # get % of the total sum for every checkpoint at once
+                    filtered_df = filtered_df.join(hourcore.percentage_split(filtered_df, split_checkpoints))
                 # if filtered_df has 2 different dates in last 2 rows, remove last row
                 if len(filtered_df) > 1 and filtered_df.iloc[-1, 0] != filtered_df.iloc[-2, 0]:
-                    filtered_df.drop(filtered_df.tail(1).index, inplace=True)
+                    filtered_df = filtered_df.iloc[:-1]
 
                 st.dataframe(filtered_df, use_container_width=True)
+                if approximate_note and operation.lower() == 'percentile':
+                    st.caption(approximate_note)
+                sidebar.download_table(filtered_df, 'hour_by_hour', key='exportTable1')
 
             st.write('## :airplane_departure: Calculate the number of lanes required based on throughput...')
 
@@ -344,38 +362,33 @@ def main():
             tempColNew3, tempColNew4 = st.columns(2)
 
             with tempColNew1:
-                precheck_throughput = st.selectbox('Select Precheck Column:', df.columns, index=None)
+                precheck_options = [column for column in filtered_df.columns if column in df.columns]
+                precheck_throughput = st.selectbox('Select Precheck Column:', precheck_options,
+                                                   index=precheck_options.index(hourcore.PRECHECK_COLUMN) if hourcore.PRECHECK_COLUMN in precheck_options else None)
 
             with tempColNew2:
                 precheck_throughput_slider = st.slider('Select Precheck Throughput (PAX/Hour):', 100, 300, 250, 5)
 
             with tempColNew3:
-                standard_throughput = st.selectbox('Select Standard Column:', df.columns, index=None)
+                standard_throughput = st.multiselect('Select Standard Column(s):', precheck_options,
+                                                     default=[column for column in checkpoint_columns if column in precheck_options])
 
             with tempColNew4:
                 standard_throughput_slider = st.slider('Select Standard Throughput (PAX/Hour):', 100, 300, 150, 5)
 
-            if precheck_throughput is not None and standard_throughput is not None:
+            if precheck_throughput is not None and len(standard_throughput) > 0:
 
                 st.write(f'Selected throughput values for `precheck` is `{precheck_throughput_slider} Pax/Hour` and for `standard` is `{standard_throughput_slider} Pax/Hour`')
 
-                if precheck_throughput is not None and precheck_throughput_slider is not None:
-                    filtered_df['Precheck Lanes Needed'] = (filtered_df[precheck_throughput] / precheck_throughput_slider).round(0).apply(lambda x: 1 if x == 0 else x)
-                    # st.dataframe(filtered_df, use_container_width=True)
+                # flow and lanes needed for every checkpoint and precheck in one table
+                # (the Precheck % and Checkpoint % columns are left out)
+                filtered_df = hourcore.lane_table(filtered_df, standard_throughput, standard_throughput_slider,
+                                                  precheck_throughput, precheck_throughput_slider)
 
-                if standard_throughput is not None and standard_throughput_slider is not None:
-                    filtered_df['Standard Lanes Needed'] = (filtered_df[standard_throughput] / standard_throughput_slider).round(0).apply(lambda x: 1 if x == 0 else x)
-                
-                # drop Precheck % and Checkpoint % columns
-                if 'Precheck %' in filtered_df.columns:
-                    filtered_df.drop(columns=['Precheck %', f'{checkpoint} %'], inplace=True)
-
-                # rearrange the columns in the dataframe 1 Checkpoint A Sum In Flow, 2 Standard Lanes Needed, 3 Precheck Sum In Flow, 4 Precheck Lanes Needed
-                filtered_df = filtered_df[[f'{checkpoint} Sum In Flow', 'Standard Lanes Needed', 'Precheck Sum In Flow', 'Precheck Lanes Needed']]
-
-                # find max lanes needed out of Precheck Lanes Needed and Standard Lanes Needed
-                max_standard = filtered_df['Standard Lanes Needed'].max()
-                max_precheck = filtered_df['Precheck Lanes Needed'].max()
+                # find max lanes needed for each checkpoint and for precheck
+                max_lanes = filtered_df.iloc[:, 1::2].max()
+                max_standard = max_lanes.iloc[:-1]
+                max_precheck = max_lanes.iloc[-1]
 
                 if operation.lower() == 'mean':
                     myOperation = 'Average'
@@ -383,11 +396,14 @@ def main():
                     myOperation = 'Maximum'
                 elif operation.lower() == 'percentile':
                     myOperation = str(quantileQ) + ' Percentile'
+                else:
+                    myOperation = statistic
 
-                if standard_throughput_slider > 0 and precheck_throughput_slider > 0 and max_standard > 0 and max_precheck > 0:
+                if standard_throughput_slider > 0 and precheck_throughput_slider > 0 and (max_standard > 0).all() and max_precheck > 0:
+                    standard_lanes = ', '.join(f'{name.replace(" Lanes Needed", "")}: `{int(lanes)}`' for name, lanes in max_standard.items())
                     st.markdown(f"""
                         - If we perform operations to get `{myOperation}` values over the data:
-                            - With **Standard throughput**: `{standard_throughput_slider} Pax/Hour` Max lanes required: `{int(max_standard)}`
+                            - With **Standard throughput**: `{standard_throughput_slider} Pax/Hour` Max lanes required: {standard_lanes}
                             - With **Precheck throughput**: `{precheck_throughput_slider} Pax/Hour` Max lanes required: `{int(max_precheck)}`
                         """, unsafe_allow_html=True)
                 else:
@@ -404,6 +420,7 @@ def main():
 
                 if showTable2Checkbox:
                     st.dataframe(filtered_df, use_container_width=True)
+                    sidebar.download_table(filtered_df, 'lanes_needed', key='exportTable2')
 
                 if showGraph2Checkbox:
                     st.bar_chart(filtered_df.iloc[:, 1::2], use_container_width=True, stack=False)
@@ -417,5 +434,8 @@ def main():
     else:
         st.warning(':warning: Please upload a file to start the analysis...')
 
+    sidebar.cache_stats()
+    sidebar.memory_stats()
+
 if __name__ == "__main__":
     main()
@@ -1,7 +1,7 @@
+import operator
 import streamlit as st
 import pandas as pd
-from utils import managecolumns, loaddata, peakrolling
-import matplotlib.pyplot as plt
+from utils import managecolumns, peakrolling, sidebar, remap, loaddata
 
 def set_session_state():
     if 'new_column_names' not in st.session_state:
@@ -20,6 +20,7 @@ def set_session_state():
         st.session_state.checked_default_col_names = False
 
 def main():
+    loaddata.use_copy_on_write()
     set_session_state()
 
     # wide mode
@@ -64,23 +65,8 @@ def main():
 
 
     if st.session_state.selected_file is not None:
-        # Delimiter selection option
-        delimiter = st.sidebar.radio('Select delimiter:', ['Comma (`,`)', 'Semicolon (`;`)', 'Tab (`\\t`)'], horizontal=True)
-
-        # Map delimiter choice to actual delimiter
-        delimiter_map = {
-            'Comma (`,`)': ',',
-            'Semicolon (`;`)': ';',
-            'Tab (`\\t`)': '\t'
-        }
-        delimiter = delimiter_map[delimiter]
-
-        header_option = st.sidebar.radio('Does the CSV file have Column Names?', ["No", "Yes"], horizontal=True)
-        
-       
-        df = loaddata.load_data(st.session_state.selected_file, header_option, delimiter)
-        
-        
+        df, header_option = sidebar.select_format("")
+
         if header_option == "Yes":
             st.session_state.now_show = True
             st.session_state.new_column_names = df.columns.tolist()
@@ -100,7 +86,7 @@ def main():
         # column length
         st.write('Number of columns: ', df.shape[1], 'Number of rows: ', df.shape[0])
         if st.checkbox('Show Summary (contains count, mean, std, min, max, etc. over each column)'):
-            st.write(df.describe())
+            sidebar.show_summary(df)
             
         st.write('### Data Preview')
         tableElement = st.empty()
@@ -166,7 +152,8 @@ def main():
         tableElement.dataframe(df)
 
         if st.session_state.now_show:
-            available_operations_between_2_cols_map_no_grp = {'add': '+', 'subtract': '-', 'multiply': '*', 'divide': '/'}
+            available_operations_between_2_cols_map_no_grp = {'add': operator.add, 'subtract': operator.sub, 'multiply': operator.mul,
+                                                              'divide': operator.truediv}
             available_operations_for_single_col_map = {'mean': 'mean', 'sum': 'sum', 'max': 'max', 'min': 'min'}
 
             # perform new operations? 
@@ -232,14 +219,19 @@ def main():
                                                 help='Select a column to group by and create a new column',
                                                 placeholder="Select column to group by...")
                         
-                        # Select values to group by
+                        # Select values to group by, through the stored code -> group tables of that column
                         with col2_col:
-                            if col1G and col1G == "SSCPType":                                
-                                df['PaxSPorPE'] = df[col1G].apply(lambda x: 1 if x in [1, 2] else 2 if x in [3, 4] else 3)
-                                st.write('''SSCPType is grouped into PaxSPorPE column with 1 Standard, 2 Priority grouped in 1
-                                         and 3 Precheck and 4 Employee grouped in 2''')
+                            remaps = remap.load_remaps()
+                            remap_names = [name for name, table in remaps.items() if col1G and table['source'] == col1G]
+                            if remap_names:
+                                remap_name = st.selectbox('Select grouping:', remap_names)
+                                df[remap_name] = remap.remap_column(df, remap_name, remaps)
+                                st.write(remaps[remap_name]['description'])
                             else:
-                                st.write("SSCPType column is not selected. Please select SSCPType column to group by. [Standard , Priority] will be grouped in 1 and [Precheck, Employee] will be grouped in 2")
+                                st.write("No grouping is stored for the selected column. Select SSCPType to group it into PaxSPorPE ([Standard , Priority] will be grouped in 1 and [Precheck, Employee] will be grouped in 2) or add a grouping below.")
+
+                        with st.expander('Add or edit a grouping (code to group table)'):
+                            sidebar.remap_editor(df, col1G)
                     
                     # Select operation to perform between columns
                     with operation_col2:
@@ -265,7 +257,8 @@ def main():
                         new_col_name = 'TempColumn'
 
                         try:
-                            df[new_col_name] = df[col1].combine(df[col2], eval(f'lambda x, y: x {operation} y'))
+                            # whole-column operation; df is a copy-on-write view, so only this column is new
+                            df[new_col_name] = operation(df[col1], df[col2])
                             
                             st.caption(f"New column with name '`{new_col_name}`' is created at the end of the DataFrame.")
                             st.write(df)
@@ -306,6 +299,9 @@ def main():
                     st.session_state.updated_column_names = df.columns.tolist()
 
                     
+            # derived columns are added to a view of the loaded frame
+            sidebar.track('prepared', df)
+
             # select, sort by column
             st.write('### Select and Sort by Column :arrow_up_down:')
 
@@ -346,10 +342,9 @@ def main():
                         st.warning('TempColumn is not present in the dataframe. Please perform operations first.', icon='⚠️')
                         st.stop()
 
-                    df = df.sort_values(by=sort_columns, ascending=ascending_order)
                     st.write(f"### Sorted Data by {', '.join(sort_columns)}")
-                    # show df but dont allow sorting
-                    st.dataframe(df, use_container_width=True)
+                    # show df through the cached sort order, without a sorted copy
+                    sidebar.show_sorted(df, sort_columns, ascending_order)
 
                 else:
                     st.write("##### Please select columns you wish to sort data by")
@@ -359,7 +354,7 @@ def main():
 
             if performRollingMaxCalc:
                 # Select a Time column for rolling sum calculation
-                st.write('Select the Time Column (in minutes 0-1440) and the Entities Columns to get the rolling sum')
+                st.write('Select the Time Column (in minutes 0-1440) and the Entities Columns to get the rolling sum (no Entities column counts rows)')
 
                 times_col, entities_col, time_window_col = st.columns(3)
 
@@ -369,14 +364,16 @@ def main():
                                             placeholder="Select Times column...", label_visibility='collapsed')
 
                 with entities_col:
-                    colE2 = st.selectbox('Select Entities column:', st.session_state.updated_column_names, 
-                                            index=None,
-                                            placeholder="Select Entities column...", label_visibility='collapsed')
+                    colE2 = st.multiselect('Select Entities columns:', st.session_state.updated_column_names,
+                                            placeholder="Select Entities columns...", label_visibility='collapsed')
 
                 with time_window_col:
                     # select values from (60, 30, 20, 15, 10, 5)
                     window_selection_vals = [5, 10, 15, 20, 30, 60]
                     colTimeWin3 = st.select_slider('Select Time Window:', window_selection_vals, value=window_selection_vals[-1] )
+
+                # estimates from row samples while the exact peaks of large files are computed
+                progressive = st.checkbox('Show quick estimates first (large files)', value=True)
             
                 # group by column
                 st.write('#### Group by Column')
@@ -385,36 +382,31 @@ def main():
                 if performGroupBy or st.session_state.now_show:
                     grpByCol1, showHHMMCol2 = st.columns(2)
                     with grpByCol1:
-                        group_by_column = st.selectbox('Select group by column:', st.session_state.updated_column_names, 
-                                                index=None,
-                                                placeholder="Select group by column...", label_visibility='collapsed')
+                        # several columns give peaks per combination, e.g. SSCPType × AirlineIdx × DepMarket
+                        group_by_column = st.multiselect('Select group by columns:', st.session_state.updated_column_names,
+                                                placeholder="Select group by columns...", label_visibility='collapsed')
                     with showHHMMCol2:
                         show_in_hhmm_format = st.checkbox('Show in HH:MM format', value=True)
 
-                    if group_by_column and colT1 and colE2:
+                    if group_by_column and colT1:
                         # check length of columns
                         if len(df.columns) != len(st.session_state.new_column_names):
                             st.session_state.new_column_names = df.columns.tolist()
-                        rollingMax = peakrolling.rolling_bin_max_sum_grouped(df, colT1, colE2, window=colTimeWin3, groupBy=group_by_column, show_in_hhmm_format=show_in_hhmm_format)
+                        # all entity columns (or row counts) from one binning, partial windows at the start of the day count
+                        rollingMax = peakrolling.rolling_peaks(df, colT1, colE2 or None, window=colTimeWin3, groupBy=group_by_column,
+                                                               show_in_hhmm_format=show_in_hhmm_format, min_periods=1, progressive=progressive)
+                        sidebar.download_table(rollingMax, 'peaks_grouped', key='exportPeaksGrouped', index=False)
+                        peakrolling.peak_contributors(df, colT1, rollingMax, window=colTimeWin3, groupBy=group_by_column)
                     else:
-                        if not colE2:
-                            df["tempEndColumn"] = 1
-                            df = peakrolling.rolling_sum_of_rows(df, "tempEndColumn", window=60)
-                            st.line_chart(df["RollingSum"])
-
                         st.warning('Please select the column names first to perform operations.', icon='⚠️')
                 else:
                     show_in_hhmm_format = st.checkbox('Show in HH:MM format', value=True)
-                    if colT1 and colE2:
-                        rollingMax, rollingMaxTime = peakrolling.rolling_bin_max_sum(df, colT1, colE2,window=colTimeWin3, show_in_hhmm_format=show_in_hhmm_format)
-                        
-                        st.write(pd.DataFrame({'RollingMax': [rollingMax], 'RollingMaxTime': [rollingMaxTime]}))
+                    if colT1:
+                        peaks = peakrolling.rolling_peaks(df, colT1, colE2 or None, window=colTimeWin3, show_in_hhmm_format=show_in_hhmm_format,
+                                                          progressive=progressive)
+                        sidebar.download_table(peaks, 'peaks', key='exportPeaks', index=False)
+                        peakrolling.peak_contributors(df, colT1, peaks, window=colTimeWin3)
                     else:
-                        if not colE2:
-                            df["tempEndColumn"] = 1
-                            df = peakrolling.rolling_sum_of_rows(df, "tempEndColumn", window=60)
-                            st.line_chart(df["RollingSum"])
-
                         st.write('Please select the column names first to perform operations.')
                     
         else:
@@ -423,6 +415,9 @@ def main():
         # Message for no file upload
         st.write('Please upload a CSV file to start the analysis.')
 
+    sidebar.cache_stats()
+    sidebar.memory_stats()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import hourcore, resultcache
+
+CHECKPOINTS = ['Checkpoint A Sum In Flow', 'Checkpoint B Sum In Flow']
+
+
+def flow_frame(days=3, step=10):
+    # time-indexed flows as the hour by hour page prepares them
+    rng = np.random.default_rng(0)
+    times = pd.date_range('2023-01-01', periods=days * 1440 // step, freq=f'{step}min')
+    df = pd.DataFrame({'Time': times.strftime('%m/%d/%Y %H:%M')})
+    for column in CHECKPOINTS + [hourcore.PRECHECK_COLUMN]:
+        df[column] = rng.integers(100, 200, len(df)).astype(float)
+    return hourcore.index_by_time(df)[0]
+
+
+def test_aggregate_through_cache():
+    # the single statistic path of the page
+    df = flow_frame()
+    table = resultcache.cached_call(hourcore.aggregate, df, ['Hour'] + CHECKPOINTS,
+                                    groupby='Hour', columns=CHECKPOINTS, operation='Mean', quantile=None, relative_accuracy=None)
+    expected = df.groupby('Hour')[CHECKPOINTS].mean().round(0)
+    pd.testing.assert_frame_equal(table, expected)
+
+
+def test_aggregate_many_through_cache():
+    # the 'Multiple' path of the page
+    df = flow_frame()
+    table = resultcache.cached_call(hourcore.aggregate_many, df, ['Hour'] + CHECKPOINTS,
+                                    groupby='Hour', columns=CHECKPOINTS, metrics=['Mean', 'Max'],
+                                    quantiles=[0.75, 0.9], relative_accuracy=None)
+    grouped = df.groupby('Hour')[CHECKPOINTS]
+    for column in CHECKPOINTS:
+        np.testing.assert_array_equal(table[(column, 'Mean')], grouped.mean()[column].round(0))
+        np.testing.assert_array_equal(table[(column, 'Max')], grouped.max()[column])
+        np.testing.assert_array_equal(table[(column, 'P90')], grouped.quantile(0.9)[column].round(0))
+
+
+def test_daily_peaks_through_cache():
+    # the daily sliding-window peaks path of the page
+    df = flow_frame()
+    flow_columns = CHECKPOINTS + [hourcore.PRECHECK_COLUMN]
+    peaks = resultcache.cached_call(hourcore.daily_peaks, df, ['Time'] + flow_columns, columns=flow_columns, window=60)
+    assert len(peaks) == 3 * len(flow_columns)
+
+    # naive check: full 60 minute windows within each day, first maximum
+    for (date, column), row in peaks.set_index(['Date', 'Column']).iterrows():
+        day = df.loc[df['Date'] == date, column].to_numpy()
+        sums = np.convolve(day, np.ones(6), mode='valid')
+        start = int(sums.argmax()) * 10
+        assert row['Peak'] == np.round(sums.max())
+        assert row['Start'] == f'{start // 60:02d}:{start % 60:02d}'
+
+
+def test_daily_peaks_window_must_fit_readings():
+    with pytest.raises(ValueError):
+        hourcore.daily_peaks(flow_frame(), CHECKPOINTS, window=45)
+
+
+@pytest.mark.parametrize('relative_accuracy', [None, 0.01])
+def test_flow_stats_use_each_column_on_its_own(relative_accuracy):
+    df = flow_frame()
+    df[CHECKPOINTS] = hourcore.fit_to_range(df[CHECKPOINTS], 120, 180)
+    assert df[CHECKPOINTS].isna().any(axis=1).sum() > df[CHECKPOINTS].isna().all(axis=1).sum()
+
+    stats = hourcore.flow_stats(df, CHECKPOINTS, relative_accuracy)
+    for column in CHECKPOINTS:
+        alone = hourcore.flow_stats(df[[column]].dropna(), [column], relative_accuracy)
+        pd.testing.assert_frame_equal(stats.loc[[column]], alone)
@@ -0,0 +1,27 @@
+import gc
+import pandas as pd
+from utils import memledger
+
+
+def test_views_share_buffers():
+    ledger = memledger.MemoryLedger()
+    df = pd.DataFrame({'a': range(1000), 'b': [1.5] * 1000})
+    view = df.copy(deep=False)
+    view['c'] = view['a'] * 2
+    ledger.record('s1', 'loaded', df)
+    ledger.record('s1', 'derived', view)
+    report = ledger.report('s1').set_index('Stage')
+    assert report.loc['derived', 'New Bytes'] == view['c'].nbytes
+    assert ledger.held_bytes('s1') == df.memory_usage(index=False).sum() + view['c'].nbytes
+
+
+def test_sessions_are_forgotten_with_their_token():
+    ledger = memledger.MemoryLedger()
+    df = pd.DataFrame({'a': range(10)})
+    tokens = {session: ledger.session_token(session) for session in ['s1', 's2']}
+    for session in tokens:
+        ledger.record(session, 'loaded', df)
+
+    del tokens['s1']
+    gc.collect()
+    assert list(ledger.report()['Session']) == ['s2']
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from utils import peakcore, peakflights
+
+
+def passengers(rows=3000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'PaxArrTime': rng.uniform(0, 1400, rows),
+        'SSCPType': rng.integers(1, 3, rows),
+        'AirlineIdx': rng.integers(1, 4, rows),
+        'DepFlightNumber': rng.integers(100, 110, rows),
+        'FlightDepTime': rng.integers(300, 1400, rows),
+    })
+
+
+def test_contributors_with_a_group_key_among_the_flight_columns():
+    df = passengers()
+    groupBy = ['SSCPType', 'AirlineIdx']
+    peaks = peakcore.rolling_peaks(df, 'PaxArrTime', groupBy=groupBy)[0]
+
+    flights = peakflights.peak_contributors(df, 'PaxArrTime', peaks, groupBy=groupBy)
+    assert list(flights.columns) == ['SSCPType', 'Entity', 'WindowStart', 'WindowEnd'] + peakflights.FLIGHT_COLUMNS + \
+        ['Contribution', 'Share']
+    # every contributor belongs to the group of its peak, and the peaks are fully attributed
+    totals = flights.groupby(groupBy)['Contribution'].sum()
+    assert totals.to_dict() == peaks.set_index(groupBy)['RollingMax'].to_dict()
+
+    airlines = peakflights.peak_contributors(df, 'PaxArrTime', peaks, groupBy=groupBy, by=peakflights.AIRLINE_COLUMNS)
+    assert len(airlines) == len(peaks)
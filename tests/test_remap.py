@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+from utils import remap
+
+
+def test_unmapped_integer_codes_are_missing():
+    result = remap.apply_mapping([1, 2, 3], [[1, 'A'], [2, 'B']])
+    assert result.iloc[:2].tolist() == ['A', 'B']
+    assert pd.isna(result.iloc[2])
+
+
+def test_integer_and_categorical_paths_agree():
+    mapping = {1: 'A', 2: 'B', 5: 'A'}
+    codes = pd.Series([1, 2, 3, 5, 9])
+    by_lookup = remap.apply_mapping(codes, mapping)
+    by_category = remap.apply_mapping(codes.astype(str), {str(k): v for k, v in mapping.items()})
+    assert by_lookup.isna().tolist() == by_category.isna().tolist() == [False, False, True, False, True]
+    assert by_lookup.dropna().tolist() == by_category.dropna().tolist() == ['A', 'B', 'A']
+
+
+def test_default_and_numeric_groups():
+    assert remap.apply_mapping([1, 2, 3], {1: 'A'}, default='Other').tolist() == ['A', 'Other', 'Other']
+    result = remap.apply_mapping(np.array([1, 2, 2]), {1: 10, 2: 20}, default=0)
+    assert result.tolist() == [10, 20, 20]
+    assert result.dtype.kind == 'i'
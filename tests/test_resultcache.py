@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+from utils import resultcache
+
+
+def _select(df, columns, scale=1):
+    return df[columns].sum() * scale
+
+
+def test_cached_call_passes_columns_keyword_to_func():
+    cache = resultcache.ResultCache(2 ** 20)
+    df = pd.DataFrame({'a': [1, 2], 'b': [3, 4], 'c': [5, 6]})
+    original, resultcache.results = resultcache.results, cache
+    try:
+        first = resultcache.cached_call(_select, df, ['a', 'b'], columns=['a', 'b'], scale=2)
+        second = resultcache.cached_call(_select, df, ['a', 'b'], columns=['a', 'b'], scale=2)
+    finally:
+        resultcache.results = original
+    assert first.to_dict() == {'a': 6, 'b': 14}
+    assert second is first
+    assert cache.stats()['hits'] == 1
+
+
+def test_cached_call_key_ignores_unread_columns():
+    df = pd.DataFrame({'a': [1, 2], 'b': [3, 4]})
+    first = resultcache.cached_call(_select, df, ['a'], columns=['a'])
+    second = resultcache.cached_call(_select, df.assign(b=[7, 8]), ['a'], columns=['a'])
+    assert second is first
+
+
+def test_fingerprint_of_views_reuses_column_hashes(monkeypatch):
+    df = pd.DataFrame({'t': [1.0, 2.0, 3.0], 'w': [1, 2, 3], 's': ['a', 'b', 'a']})
+    df['c'] = df['s'].astype('category')
+    fingerprint = resultcache.dataset_fingerprint(resultcache.read_only(df))
+
+    hashed = []
+    hash_pandas_object = pd.util.hash_pandas_object
+    monkeypatch.setattr(pd.util, 'hash_pandas_object', lambda *args, **kwargs: hashed.append(args) or hash_pandas_object(*args, **kwargs))
+    view = df.copy(deep=False)
+    assert resultcache.dataset_fingerprint(view) == fingerprint
+    # only the categories, not the data
+    assert all(isinstance(args[0], pd.Index) for args in hashed)
+
+    # a write copies the column, which is then hashed again
+    view.loc[0, 't'] = 5.0
+    view['s'] = view['s'].str.upper()
+    assert resultcache.dataset_fingerprint(view, ['t']) != resultcache.dataset_fingerprint(df, ['t'])
+    assert resultcache.dataset_fingerprint(view, ['s']) != resultcache.dataset_fingerprint(df, ['s'])
+    assert resultcache.dataset_fingerprint(view, ['w', 'c']) == resultcache.dataset_fingerprint(df, ['w', 'c'])
+
+
+def test_is_cached_checks_without_counting():
+    cache = resultcache.ResultCache(2 ** 20)
+    df = pd.DataFrame({'a': [1, 2], 'b': [3, 4]})
+    original, resultcache.results = resultcache.results, cache
+    try:
+        assert not resultcache.is_cached(_select, df, ['a'], columns=['a'])
+        resultcache.cached_call(_select, df, ['a'], columns=['a'])
+        assert resultcache.is_cached(_select, df.copy(deep=False), ['a'], columns=['a'])
+        assert not resultcache.is_cached(_select, df, ['a'], columns=['a'], scale=2)
+    finally:
+        resultcache.results = original
+    assert cache.stats()['hits'] == 0 and cache.stats()['misses'] == 1
+
+
+def test_fingerprint_follows_in_place_writes():
+    df = pd.DataFrame({'t': [1.0, 2.0, 3.0], 'w': [1, 2, 3]})
+    first = resultcache.dataset_fingerprint(df)
+    df.loc[0, 't'] = 99.0
+    second = resultcache.dataset_fingerprint(df)
+    df.iloc[1, 1] = 7
+    assert len({first, second, resultcache.dataset_fingerprint(df)}) == 3
+
+
+def test_read_only_frames_raise_on_writes():
+    df = resultcache.read_only(pd.DataFrame({'t': [1.0, 2.0], 'c': pd.Categorical(['a', 'b'])}))
+    with pytest.raises(ValueError):
+        df.loc[0, 't'] = 5.0
+    view = df.copy(deep=False)
+    view.loc[0, 't'] = 5.0
+    assert df.loc[0, 't'] == 1.0
@@ -0,0 +1,95 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+from utils import hourcore, peakcore, service
+
+
+@pytest.fixture
+def server():
+    # batch window long enough for the concurrent requests below to join one batch
+    server = service.make_server(port=0, batch_window=0.2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def call(server, method, path, body=None):
+    data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode()
+    request = urllib.request.Request(f'http://127.0.0.1:{server.server_port}{path}', data=data, method=method)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def passengers(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'Time': rng.uniform(0, 1440, 5000), 'GrpSize': rng.integers(1, 4, 5000),
+                       'Visitors': rng.integers(0, 2, 5000), 'Type': rng.choice(['A', 'B'], 5000)})
+    path = tmp_path / 'passengers.csv'
+    df.to_csv(path, index=False)
+    return str(path), pd.read_csv(path)
+
+
+def test_concurrent_peaks_are_batched(server, passengers):
+    path, df = passengers
+    status, loaded = call(server, 'POST', '/datasets', {'path': path})
+    assert status == 200
+
+    requests = [{'entityColumns': ['GrpSize']}, {'entityColumns': ['Visitors', 'GrpSize'], 'window': 30},
+                {'entityColumns': ['Visitors']}, {'entityColumns': []}, {}]
+    bodies = [dict(request, dataset=loaded['dataset'], timeColumn='Time', groupBy='Type') for request in requests]
+    with ThreadPoolExecutor(len(bodies)) as pool:
+        replies = list(pool.map(lambda body: call(server, 'POST', '/peaks', body), bodies))
+
+    for body, (status, reply) in zip(bodies, replies):
+        assert status == 200
+        expected = peakcore.rolling_peaks(df, 'Time', body['entityColumns'] if body.get('entityColumns') else None,
+                                          window=body.get('window', 60), groupBy='Type')[0]
+        assert pd.DataFrame(reply['peaks']).to_dict('list') == expected.to_dict('list')
+
+    stats = server.service.stats()['/peaks']
+    assert stats['mean_batch_size'] > 1
+
+
+def test_aggregate(server, tmp_path):
+    times = pd.date_range('2023-01-01', periods=288, freq='10min')
+    df = pd.DataFrame({'Time': times.strftime('%m/%d/%Y %H:%M'), 'Flow': np.arange(288.0)})
+    path = tmp_path / 'flows.csv'
+    df.to_csv(path, index=False)
+
+    status, loaded = call(server, 'POST', '/datasets', {'path': str(path), 'time_index': True})
+    assert status == 200
+    status, reply = call(server, 'POST', '/aggregate', {'dataset': loaded['dataset'], 'groupby': 'Hour', 'columns': ['Flow'],
+                                                        'metrics': ['Mean', 'Max'], 'quantiles': [0.5]})
+    assert status == 200
+    expected = hourcore.aggregate_many(hourcore.index_by_time(df)[0], 'Hour', ['Flow'], ['Mean', 'Max'], [0.5])
+    assert reply['table']['index'] == expected.index.tolist()
+    assert reply['table']['data'] == expected.to_numpy().tolist()
+
+
+def test_errors(server, passengers):
+    path, _ = passengers
+    status, reply = call(server, 'POST', '/peaks', {'dataset': 'missing', 'timeColumn': 'Time'})
+    assert status == 404 and 'Unknown dataset' in reply['error']
+
+    status, reply = call(server, 'POST', '/peaks', b'{not json')
+    assert status == 400
+
+    status, reply = call(server, 'GET', '/nowhere')
+    assert status == 404
+
+    _, loaded = call(server, 'POST', '/datasets', {'path': path})
+    for bad in ({'bin_interval': 0}, {'window': -5}, {'window': 2.5}, {'bin_interval': '5'}):
+        status, reply = call(server, 'POST', '/peaks', {'dataset': loaded['dataset'], 'timeColumn': 'Time', **bad})
+        name, value = next(iter(bad.items()))
+        assert status == 400 and reply['error'] == f'ValueError: {name} must be a positive integer, got {value!r}'
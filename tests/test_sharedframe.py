@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from utils import sharedframe
+
+
+def frame():
+    df = pd.DataFrame({
+        'Time': [5.0, 1.5, 3.0, 2.0],
+        'Count': np.array([1, 2, 3, 4], dtype=np.int64),
+        'Airline': ['zz', 'aa', None, 'mm'],
+    }, index=pd.Index([10, 20, 30, 40], name='Row'))
+    df['Mixed'] = pd.Series(['b', 'a', None, 'b'], index=df.index, dtype=object)
+    return df
+
+
+def test_attach_returns_the_published_frame(tmp_path):
+    root = str(tmp_path)
+    df = frame()
+    assert sharedframe.publish(df, 'f', root)
+    # the name stands for the content, a second publish leaves the frame alone
+    assert not sharedframe.publish(df.head(1), 'f', root)
+
+    attached = sharedframe.attach('f', root)
+    pd.testing.assert_frame_equal(attached.drop(columns='Mixed'), df.drop(columns='Mixed'))
+    # object columns attach as categoricals, their categories sorted
+    assert list(attached['Mixed'].cat.categories) == ['a', 'b']
+    assert attached['Mixed'].astype(object).where(attached['Mixed'].notna(), None).tolist() == ['b', 'a', None, 'b']
+    assert attached.groupby('Airline').size().index.tolist() == ['aa', 'mm', 'zz']
+
+    with pytest.raises(ValueError):
+        attached.loc[10, 'Time'] = 0.0
+    view = attached.copy(deep=False)
+    view.loc[10, 'Airline'] = 'new'
+    assert attached.loc[10, 'Airline'] == 'zz'
+
+
+def test_attach_unpublished_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        sharedframe.attach('missing', str(tmp_path))
+
+
+def test_last_release_removes_the_frame(tmp_path):
+    root = str(tmp_path)
+    built = []
+
+    def build():
+        built.append(1)
+        return frame()
+
+    first_df, first = sharedframe.shared_frame('f', build, root)
+    second_df, second = sharedframe.shared_frame('f', build, root)
+    assert len(built) == 1
+    pd.testing.assert_frame_equal(first_df, second_df)
+    assert sharedframe.status(root)[['Name', 'Rows', 'Leases']].values.tolist() == [['f', 4, 2]]
+
+    sharedframe.release('f', first, root)
+    assert sharedframe.status(root)['Leases'].tolist() == [1]
+    sharedframe.release('f', second, root)
+    assert sharedframe.status(root).empty
+    # mapped columns stay readable after the files are removed
+    assert first_df['Time'].sum() == 11.5
+
+
+def test_cleanup_prunes_leases_of_ended_processes(tmp_path):
+    root = str(tmp_path)
+    sharedframe.publish(frame(), 'dead', root)
+    sharedframe.publish(frame(), 'alive', root)
+    ended = subprocess.Popen([sys.executable, '-c', 'pass'])
+    ended.wait()
+    os.makedirs(os.path.join(root, 'leases', 'dead'))
+    open(os.path.join(root, 'leases', 'dead', f'{ended.pid}-token'), 'w').close()
+    token = sharedframe.acquire('alive', root)
+
+    assert sharedframe.cleanup(root) == ['dead']
+    assert sharedframe.status(root)['Name'].tolist() == ['alive']
+    sharedframe.release('alive', token, root)
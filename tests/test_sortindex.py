@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from utils import resultcache, sortindex
+
+
+def frame():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'a': rng.integers(0, 5, 500).astype(float), 'b': rng.choice(['x', 'y', None], 500), 'c': rng.random(500)})
+    df.loc[::7, 'a'] = np.nan
+    return df
+
+
+def test_sort_order_matches_stable_sort_values():
+    df = frame()
+    for columns, ascending in [(['a'], True), (['b'], False), (['a', 'b'], [True, False]), (['b', 'a', 'c'], True)]:
+        expected = df.sort_values(columns, ascending=ascending, kind='stable').index.to_numpy()
+        np.testing.assert_array_equal(sortindex.sort_order(df, columns, ascending), expected)
+
+
+def test_cached_order_is_reused():
+    # the path of sidebar.show_sorted
+    df = frame()
+    first = sortindex.cached_order(df, ['b', 'a'], False)
+    hits = resultcache.results.stats()['hits']
+    second = sortindex.cached_order(df.copy(deep=False), ['b', 'a'], False)
+    assert second is first
+    assert resultcache.results.stats()['hits'] == hits + 1
+    page = sortindex.take_sorted(df, first, 0, 10)
+    pd.testing.assert_frame_equal(page, df.sort_values(['b', 'a'], ascending=False, kind='stable').head(10))
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import summarystats
+
+QUANTILES = [0, 0.1, 0.25, 0.5, 0.75, 0.9, 1]
+
+
+@pytest.mark.parametrize('values', [
+    [-3.0, -1.0],
+    [1.0, 2.0, 3.0, 4.0, 100.0],
+    list(np.random.default_rng(0).lognormal(0, 2, 1000)),
+    list(np.random.default_rng(1).integers(-50, 5000, 777)),
+])
+def test_quantiles_within_the_bin_width(values):
+    # two chunks, so merged histograms are covered too
+    half = len(values) // 2
+    summary = summarystats.summarize([pd.DataFrame({'a': values[:half]}), pd.DataFrame({'a': values[half:]})])['a']
+    expected = pd.Series(values).quantile(QUANTILES)
+    for q in QUANTILES:
+        assert abs(summary.quantile(q) - expected[q]) < summary.bin_width()
+
+
+def test_infinite_values_are_kept_out_of_the_histogram():
+    summary = summarystats.summarize(pd.DataFrame({'a': [np.inf, 1.0, 2.0, 3.0, -np.inf]}))['a']
+    assert summary.histogram().sum() == 3
+    assert summary.quantile(0) == -np.inf and summary.quantile(1) == np.inf
+    assert summary.quantile(0.5) == pytest.approx(2.0, abs=summary.bin_width())
+    table = summarystats.summary_table({'a': summary})
+    assert table.loc['count', 'a'] == 5
@@ -0,0 +1,73 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from utils import batch, workqueue
+
+
+def scenario(folder, files=2, rows=2000):
+    # replication files in the Simio passenger format, without a header row
+    rng = np.random.default_rng(0)
+    folder.mkdir()
+    for i in range(files):
+        df = pd.DataFrame({column: rng.integers(1, 4, rows) for column in batch.COLUMNS})
+        df['PaxArrTime'] = rng.uniform(0, 1400, rows)
+        df['LobbyDelay'] = rng.uniform(0, 30, rows)
+        df.to_csv(folder / f'rep{i}.csv', header=False, index=False)
+    return str(folder)
+
+
+def test_claim_starts_a_fresh_lease(tmp_path):
+    queue = str(tmp_path / 'queue')
+    workqueue.create_queue(queue, scenario(tmp_path / 'scen', files=1))
+    (unit_id,) = workqueue._units(queue, 'pending')
+    # a unit that waited in pending/ for an hour
+    old = time.time() - 3600
+    os.utime(workqueue._path(queue, 'pending', unit_id), (old, old))
+
+    unit = workqueue.claim(queue, 'w1')
+    assert unit['id'] == unit_id
+    # another worker checking leases right after the claim must not take it back
+    assert workqueue.requeue_expired(queue, lease=60) == []
+    assert workqueue.status(queue)['claimed'] == 1
+
+
+def test_claim_skips_a_unit_requeued_meanwhile(tmp_path, monkeypatch):
+    queue = str(tmp_path / 'queue')
+    workqueue.create_queue(queue, scenario(tmp_path / 'scen'))
+    first, second = workqueue._units(queue, 'pending')
+    read = workqueue._read
+
+    def released_once(path):
+        # the first claimed unit is released by another worker before it is read
+        if first in path and 'claimed' in path:
+            monkeypatch.setattr(workqueue, '_read', read)
+            raise FileNotFoundError(path)
+        return read(path)
+
+    monkeypatch.setattr(workqueue, '_read', released_once)
+    assert workqueue.claim(queue, 'w1')['id'] == second
+
+
+def test_worker_results_merge_like_get_peaks(tmp_path):
+    folder = scenario(tmp_path / 'scen')
+    queue = str(tmp_path / 'queue')
+    workqueue.create_queue(queue, folder)
+    assert workqueue.run_worker(queue, 'w1') == 2
+    assert workqueue.status(queue) == {'pending': 0, 'claimed': 0, 'done': 2, 'failed': 0}
+
+    merged = workqueue.merge(queue)[(60, 'PaxSPorPE')]
+    expected = batch.get_peaks(folder, window=60, show_in_hhmm_format=True)
+    for got, want in zip(merged, expected):
+        assert got.equals(want)
+
+
+def test_scenario_report_labels_the_groups_it_was_given(tmp_path):
+    folder = scenario(tmp_path / 'scen')
+    for groupBy in ['SSCPType', ['SSCPType', 'AirlineIdx']]:
+        results = {file: batch.file_peaks(os.path.join(folder, file), groupBy=groupBy) for file in batch.scenario_files(folder)}
+        tables = batch.scenario_report(*batch.combine_peaks(results), confidence=0.9, n_resamples=200, groupBy=groupBy)
+        keys = [groupBy] if isinstance(groupBy, str) else groupBy
+        assert list(tables['sscpPerc'].columns) == keys + batch.scenario_files(folder)
+        ci_keys = keys if len(keys) > 1 else ['PaxType']
+        assert len(tables['peak_ci'][ci_keys].drop_duplicates()) == len(tables['peaks_grouped'][ci_keys].drop_duplicates())
@@ -0,0 +1,242 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+from . import peakcore, peakstats, export, remap, sortindex
+
+# Batch peaks over a scenario folder of replication files, as done in process.ipynb.
+# Only the pure modules are used, so this runs without streamlit or plotting libraries.
+
+# column names of the Simio Input Generator passenger files (they have no header row)
+COLUMNS = ['ReplicationNum', 'AirlineIdx', 'FlightDepTime', 'DepMarket', 'SSCPType', 'GrpSize', 'PaxArrTime', 'PaxSpeed',
+           'SSCPDelay', 'Visitors', 'LobbyDelay', 'DepFlightNumber', 'PaxType', 'PaxIDNum']
+
+# incremental mode: per-file results and their manifest, kept inside the scenario folder by default
+CACHE_DIR = '.peaks_cache'
+MANIFEST = 'manifest.json'
+
+
+def read_passengers(path):
+    df = pd.read_csv(path, header=None, names=COLUMNS)
+
+    # SSCPType grouped into PaxSPorPE with the same stored table as the app
+    df['PaxSPorPE'] = remap.remap_column(df, 'PaxSPorPE')
+
+    df['PaxSSCPTime'] = df['PaxArrTime'] + df['LobbyDelay']
+
+    # sort by PaxSSCPTime, with the same stable sort order as the sort panel
+    return df.take(sortindex.sort_order(df, ['PaxSSCPTime']))
+
+
+def file_peaks(path, window=60, show_in_hhmm_format=True, groupBy='PaxSPorPE', df=None):
+    """
+    Peaks of one replication file, or of its already read passengers df.
+
+    Returns (peaks, peaks_grouped, sscp_perc):
+    - peaks: one row with 'Rolling Max' and 'Time' over all passengers.
+    - peaks_grouped: PaxType, RollingMax and RollingMaxTime per groupBy group (PaxSPorPE by default).
+    - sscp_perc: % of passengers in each groupBy group.
+    """
+    if df is None:
+        df = read_passengers(path)
+
+    rolling_max, rolling_max_time, _ = peakcore.rolling_bin_max_sum(df, 'PaxSSCPTime', 'GrpSize', bin_interval=1, window=window,
+                                                                     show_in_hhmm_format=show_in_hhmm_format)
+    peaks = pd.DataFrame({'Rolling Max': [rolling_max], 'Time': [rolling_max_time]})
+
+    peaks_grouped, _ = peakcore.rolling_bin_max_sum_grouped(df, 'PaxSSCPTime', 'GrpSize', bin_interval=1, window=window,
+                                                            groupBy=groupBy, show_in_hhmm_format=show_in_hhmm_format)
+
+    sscp_perc = df[groupBy].value_counts(normalize=True) * 100
+    return peaks, peaks_grouped, sscp_perc
+
+
+def scenario_files(folder):
+    return sorted(file for file in os.listdir(folder) if file.endswith('.csv'))
+
+
+def file_hash(path, block_size=2**20):
+    # content hash of a file, read in blocks
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_key(window, show_in_hhmm_format):
+    # everything besides the file content that changes a file's results, the remapping table included
+    params = {'window': window, 'hhmm': show_in_hhmm_format, 'remap': remap.load_remaps()['PaxSPorPE']}
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def _read_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(cache_dir, manifest):
+    # write to a temporary file first, so an interrupted run never leaves a broken manifest
+    path = os.path.join(cache_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def cached_file_peaks(folder, window=60, show_in_hhmm_format=True, cache_dir=None):
+    """
+    file_peaks results of every csv file in a scenario folder, computing only new or changed files.
+
+    The manifest keeps size, mtime and content hash of every file with the name of its stored
+    results. Files with the same size and mtime are not read at all; files whose mtime changed
+    are hashed and only recomputed when their content did. Results of removed files are dropped.
+
+    Parameters:
+    - cache_dir: folder for the manifest and per-file results (default: CACHE_DIR inside folder).
+
+    Returns (results, processed): dict file -> (peaks, peaks_grouped, sscp_perc) and the list of
+    files computed in this call.
+    """
+    cache_dir = cache_dir or os.path.join(folder, CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    params = params_key(window, show_in_hhmm_format)
+    manifest = _read_manifest(cache_dir)
+    files = scenario_files(folder)
+
+    results, processed, updated = {}, [], {}
+    for file in files:
+        path = os.path.join(folder, file)
+        stat = os.stat(path)
+        entry = manifest.get(file)
+        if entry and entry['params'] == params and (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime_ns):
+            content = entry['hash']
+        else:
+            content = file_hash(path)
+        result_file = f'{content}-{params}.pkl'
+        result_path = os.path.join(cache_dir, result_file)
+
+        if entry and entry['result'] == result_file and os.path.exists(result_path):
+            results[file] = pd.read_pickle(result_path)
+        else:
+            results[file] = file_peaks(path, window=window, show_in_hhmm_format=show_in_hhmm_format)
+            pd.to_pickle(results[file], result_path)
+            processed.append(file)
+        updated[file] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': content, 'params': params, 'result': result_file}
+
+    # drop results no file points to anymore
+    kept = {entry['result'] for entry in updated.values()}
+    for entry in manifest.values():
+        if entry['result'] not in kept and os.path.exists(os.path.join(cache_dir, entry['result'])):
+            os.remove(os.path.join(cache_dir, entry['result']))
+    _write_manifest(cache_dir, updated)
+    return results, processed
+
+
+def combine_peaks(results):
+    """
+    Scenario tables from per-file results (dict file -> file_peaks result).
+
+    Returns (peaks, peaks_grouped, sscp_perc), the first two indexed by (File, row) and
+    sscp_perc with one column per file, or None when there are no results.
+    """
+    if len(results) == 0:
+        return None
+
+    peaks = pd.concat({file: result[0] for file, result in results.items()}, names=['File', None])
+    peaks_grouped = pd.concat({file: result[1] for file, result in results.items()}, names=['File', None])
+    sscp_perc = pd.DataFrame({file: result[2] for file, result in results.items()})
+    return peaks, peaks_grouped, sscp_perc
+
+
+def get_peaks(folder, window=60, show_in_hhmm_format=True, incremental=False, cache_dir=None):
+    """
+    Peaks of every csv file in a scenario folder.
+
+    With incremental, per-file results are kept in cache_dir and only new or changed files
+    are processed (see cached_file_peaks).
+
+    Returns (peaks, peaks_grouped, sscp_perc), the first two indexed by (File, row) and
+    sscp_perc with one column per file, or None when the folder has no csv files.
+    """
+    if incremental:
+        results, _ = cached_file_peaks(folder, window=window, show_in_hhmm_format=show_in_hhmm_format, cache_dir=cache_dir)
+    else:
+        results = {file: file_peaks(os.path.join(folder, file), window=window, show_in_hhmm_format=show_in_hhmm_format)
+                   for file in scenario_files(folder)}
+    return combine_peaks(results)
+
+
+def watch(folder, callback, interval=30, window=60, show_in_hhmm_format=True, cache_dir=None):
+    """
+    Poll a scenario folder and call callback(tables, processed) whenever files were added,
+    changed or removed, with the scenario tables from combine_peaks. Runs until interrupted.
+    """
+    previous = None
+    while True:
+        results, processed = cached_file_peaks(folder, window=window, show_in_hhmm_format=show_in_hhmm_format, cache_dir=cache_dir)
+        if processed or sorted(results) != previous:
+            callback(combine_peaks(results), processed)
+        previous = sorted(results)
+        time.sleep(interval)
+
+
+def scenario_report(peaks, peaks_grouped, sscp_perc, confidence=None, n_resamples=10000, groupBy='PaxSPorPE'):
+    # tables of a scenario as written by export.export_report, one row per file (and group);
+    # groupBy is the column or key columns the file peaks were grouped by
+    keys = peakcore.column_list(groupBy)
+    tables = {
+        'peaks': peaks.droplevel(1).reset_index(),
+        'peaks_grouped': peaks_grouped.droplevel(1).reset_index(),
+        'sscpPerc': sscp_perc.rename_axis(keys).reset_index(),
+    }
+    if confidence:
+        # bootstrap intervals of the peak statistics across the replication files
+        tables['peak_ci'] = peakstats.peak_confidence_intervals(tables['peaks_grouped'], groupBy='PaxType' if len(keys) == 1 else keys,
+                                                                n_resamples=n_resamples, confidence=confidence)
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rolling peaks for every replication file of a scenario folder.')
+    parser.add_argument('folder', help='folder with the replication csv files')
+    parser.add_argument('--window', type=int, default=60, help='rolling window in minutes')
+    parser.add_argument('--hhmm', action='store_true', help='report peak times in HH:MM format')
+    parser.add_argument('--out', default='reports', help='output folder')
+    parser.add_argument('--format', choices=export.FORMATS, default='csv', help='output format')
+    parser.add_argument('--workbook', help='for xlsx, write all tables into this single workbook')
+    parser.add_argument('--ci', type=float, metavar='LEVEL', help='add bootstrap confidence intervals at this level, e.g. 0.95')
+    parser.add_argument('--resamples', type=int, default=10000, help='bootstrap resamples for --ci')
+    parser.add_argument('--incremental', action='store_true', help='keep per-file results and only process new or changed files')
+    parser.add_argument('--cache-dir', help=f'folder for the per-file results (default: {CACHE_DIR} inside the scenario folder)')
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help='keep polling the folder at this interval and rewrite the report when files change')
+    args = parser.parse_args()
+
+    def write_report(result, processed=None):
+        if processed is not None:
+            print(f'{len(processed)} file(s) processed: {", ".join(processed)}')
+        if result is None:
+            return
+        tables = scenario_report(*result, confidence=args.ci, n_resamples=args.resamples)
+        for path in export.export_report(tables, args.out, format=args.format, workbook=args.workbook):
+            print(path)
+
+    if args.watch:
+        watch(args.folder, write_report, interval=args.watch, window=args.window, show_in_hhmm_format=args.hhmm,
+              cache_dir=args.cache_dir)
+        return
+
+    result = get_peaks(args.folder, window=args.window, show_in_hhmm_format=args.hhmm, incremental=args.incremental,
+                       cache_dir=args.cache_dir)
+    if result is None:
+        parser.error(f'No csv files in {args.folder}')
+    write_report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# Report export for peak, percentile and lane tables. Tables are written in chunks of
+# rows so memory stays flat for large tables, and independent files are written in
+# parallel. pyarrow (parquet) and openpyxl (xlsx) are only imported when used.
+
+FORMATS = ('csv', 'parquet', 'xlsx')
+
+# rows per chunk (csv), row group (parquet) or batch of appended rows (xlsx)
+CHUNK_ROWS = 100_000
+
+# xlsx limits
+MAX_SHEET_NAME = 31
+MAX_SHEET_ROWS = 1_048_576
+
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _frame(df, index):
+    # move the index into columns when it is exported and flatten MultiIndex columns
+    # to 'level1 level2' strings, so every writer sees plain named columns
+    if index:
+        df = df.reset_index()
+    if isinstance(df.columns, pd.MultiIndex):
+        columns = [' '.join(str(level) for level in column if str(level) != '') for column in df.columns]
+    else:
+        columns = [str(column) for column in df.columns]
+    return df.set_axis(columns, axis=1)
+
+
+def write_csv(df, target, index=False, chunk_rows=CHUNK_ROWS):
+    df = _frame(df, index)
+    if isinstance(target, (str, os.PathLike)):
+        f = open(target, 'w', newline='', encoding='utf-8')
+    else:
+        # text view over the caller's binary buffer
+        f = io.TextIOWrapper(target, encoding='utf-8', newline='')
+    try:
+        df.iloc[:0].to_csv(f, index=False)
+        for chunk in _chunks(df, chunk_rows):
+            chunk.to_csv(f, header=False, index=False)
+    finally:
+        if isinstance(target, (str, os.PathLike)):
+            f.close()
+        else:
+            # leave the caller's buffer open
+            f.flush()
+            f.detach()
+
+
+def write_parquet(df, target, index=False, chunk_rows=CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = _frame(df, index)
+    # from the whole frame: the type of an object column is inferred from its values, and
+    # an empty slice would make it null
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(target, schema) as writer:
+        # one row group per chunk
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_xlsx(sheets, target, index=False, chunk_rows=CHUNK_ROWS):
+    """
+    Write one or more tables to a workbook with openpyxl's constant-memory write-only mode.
+
+    Parameters:
+    - sheets: dict of sheet name -> DataFrame.
+    - target: path or binary buffer.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for name, df in sheets.items():
+        df = _frame(df, index)
+        if len(df) >= MAX_SHEET_ROWS:
+            raise ValueError(f"Table '{name}' has {len(df)} rows, more than an xlsx sheet can hold. Use csv or parquet.")
+        sheet = workbook.create_sheet(str(name)[:MAX_SHEET_NAME])
+        sheet.append(list(df.columns))
+        for chunk in _chunks(df, chunk_rows):
+            # convert the chunk to python objects at once instead of cell by cell
+            for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+                sheet.append(row)
+    workbook.save(target)
+
+
+def write_table(df, target, format=None, index=False, chunk_rows=CHUNK_ROWS, sheet_name='Sheet1'):
+    """
+    Write a single table as csv, parquet or xlsx.
+
+    Parameters:
+    - df: DataFrame to write.
+    - target: file path, or a buffer (binary for parquet/xlsx).
+    - format: one of FORMATS, taken from the file extension when not given.
+    - index: also write the index as columns.
+    """
+    format = format or os.path.splitext(str(target))[1].lstrip('.').lower()
+    if format == 'csv':
+        write_csv(df, target, index=index, chunk_rows=chunk_rows)
+    elif format == 'parquet':
+        write_parquet(df, target, index=index, chunk_rows=chunk_rows)
+    elif format == 'xlsx':
+        write_xlsx({sheet_name: df}, target, index=index, chunk_rows=chunk_rows)
+    else:
+        raise ValueError(f"Unknown export format '{format}', expected one of {', '.join(FORMATS)}")
+
+
+def table_bytes(df, format, index=False):
+    # table as file content, for download buttons
+    buffer = io.BytesIO()
+    write_table(df, buffer, format=format, index=index)
+    return buffer.getvalue()
+
+
+def export_report(tables, folder, format='csv', index=False, workers=None, workbook=None):
+    """
+    Write every table of a report to folder, in parallel.
+
+    Parameters:
+    - tables: dict of name -> DataFrame.
+    - folder: output folder, created if missing.
+    - format: one of FORMATS.
+    - index: also write the index as columns.
+    - workers: number of writer threads (default: one per table, at most os.cpu_count()).
+    - workbook: for xlsx, write all tables as sheets of this single workbook file name instead
+      of one workbook per table (sheets of one workbook cannot be written in parallel).
+
+    Returns the list of written paths.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format '{format}', expected one of {', '.join(FORMATS)}")
+    os.makedirs(folder, exist_ok=True)
+
+    if format == 'xlsx' and workbook:
+        path = os.path.join(folder, workbook)
+        write_xlsx(tables, path, index=index)
+        return [path]
+
+    paths = {name: os.path.join(folder, f'{name}.{format}') for name in tables}
+    workers = workers or min(len(tables), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_table, df, paths[name], format, index) for name, df in tables.items()]
+        for future in futures:
+            # re-raise the first writer error
+            future.result()
+    return list(paths.values())
+
@@ -0,0 +1,380 @@
+import re
+import numpy as np
+import pandas as pd
+from . import quantilesketch
+
+# Column-wise computations for the hour by hour page. Every 'Checkpoint * Sum In Flow'
+# column is handled in the same array operation instead of one checkpoint per pass.
+
+PRECHECK_COLUMN = 'Precheck Sum In Flow'
+
+# 'checkpoint' followed by an optional space and a name, e.g. 'Checkpoint A Sum In Flow'
+CHECKPOINT_PATTERN = re.compile(r'^(checkpoint\s*.+?)\s+sum in flow$', re.IGNORECASE)
+
+STATS_QUANTILES = [0.6, 0.7, 0.75, 0.8, 0.9, 0.95, 0.99]
+
+# statistics aggregate_many computes besides percentiles
+METRICS = ['Mean', 'Max', 'Min', 'Sum', 'Count']
+
+
+def checkpoint_columns(columns):
+    # all checkpoint flow columns, in file order
+    return [column for column in columns if CHECKPOINT_PATTERN.match(str(column))]
+
+
+def flow_name(column):
+    # 'Checkpoint A Sum In Flow' -> 'Checkpoint A', 'Precheck Sum In Flow' -> 'Precheck'
+    return re.sub(r'\s+sum in flow$', '', str(column), flags=re.IGNORECASE)
+
+
+def count_negative_rows(df, columns):
+    # number of rows with a negative value in any of the columns
+    return int((df[columns].to_numpy() < 0).any(axis=1).sum())
+
+
+def fit_to_range(values, min_range=100, max_range=200, divisors=(1, 2, 3)):
+    """
+    Divide each value by the first divisor that brings it into [min_range, max_range].
+
+    Works on whole columns at once; values that cannot be brought into range become NaN.
+
+    Parameters:
+    - values: array-like (Series, DataFrame or ndarray) of flows.
+    - min_range, max_range: inclusive bounds.
+    - divisors: divisors to try, in order.
+    """
+    flows = np.asarray(values, dtype=float)
+    result = np.full(flows.shape, np.nan)
+    # go through the divisors backwards so the first matching divisor wins
+    for divisor in reversed(divisors):
+        rounded = np.round(flows / divisor)
+        result = np.where((rounded >= min_range) & (rounded <= max_range), rounded, result)
+    return result
+
+
+def flow_stats(df, columns, relative_accuracy=None):
+    # average and percentiles of each column, one row per column, over that column's own
+    # non-missing values; percentiles come from quantile sketches within relative_accuracy when it is given
+    if relative_accuracy:
+        sketches = quantilesketch.sketch_columns(df, None, columns, relative_accuracy)
+        stats = pd.DataFrame({q: [sketches[column].quantile(q).iloc[0] for column in columns] for q in STATS_QUANTILES}, index=columns)
+    else:
+        stats = df[columns].quantile(STATS_QUANTILES).T
+    stats.columns = [f'{round(q * 100)}th' for q in STATS_QUANTILES]
+    stats.insert(0, 'Average', df[columns].mean())
+    return stats
+
+
+def percentage_split(table, checkpoints, precheck=PRECHECK_COLUMN):
+    """
+    Share of Precheck and of each checkpoint in their combined flow.
+
+    Returns a DataFrame with 'Precheck %' and '<checkpoint> %' columns. With more than one
+    checkpoint the Precheck share is reported against each of them.
+    """
+    pre = table[precheck].to_numpy(dtype=float)[:, None]
+    flows = table[checkpoints].to_numpy(dtype=float)
+    total = pre + flows
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pre_share = pre / total * 100
+        checkpoint_share = flows / total * 100
+
+    split = {}
+    for i, checkpoint in enumerate(checkpoints):
+        name = flow_name(checkpoint)
+        split['Precheck %' if len(checkpoints) == 1 else f'Precheck % ({name})'] = pre_share[:, i]
+        split[f'{name} %'] = checkpoint_share[:, i]
+    return pd.DataFrame(split, index=table.index)
+
+
+def lanes_needed(table, columns, throughput):
+    # lanes per row for each column at the given throughput (PAX/Hour), at least one lane
+    lanes = np.round(table[columns].to_numpy(dtype=float) / throughput)
+    lanes[lanes == 0] = 1
+    return pd.DataFrame(lanes, index=table.index, columns=[f'{flow_name(column)} Lanes Needed' for column in columns])
+
+
+def lane_table(table, standard_columns, standard_throughput, precheck_column, precheck_throughput):
+    """
+    Flow and lanes needed for every standard (checkpoint) column and the precheck column.
+
+    Returns one table with each flow column followed by its lanes column.
+    """
+    standard_lanes = lanes_needed(table, standard_columns, standard_throughput)
+    precheck_lanes = lanes_needed(table, [precheck_column], precheck_throughput)
+
+    result = {}
+    for column, lanes in zip(standard_columns, standard_lanes.columns):
+        result[column] = table[column]
+        result[lanes] = standard_lanes[lanes]
+    result[precheck_column] = table[precheck_column]
+    result[precheck_lanes.columns[0]] = precheck_lanes.iloc[:, 0]
+    return pd.DataFrame(result, index=table.index)
+
+
+def index_by_time(df, column='Time', format='%m/%d/%Y %H:%M'):
+    """
+    Parse the time column, sort the frame by it once and index it by time.
+
+    Also adds the Hour, Month, Day, Year, Quarter and Date columns used for grouping.
+
+    Returns (df, offsets) where offsets maps 'day' and 'month' to a Series with the
+    position of the first row of each period, indexed by period.
+    """
+    times = pd.DatetimeIndex(pd.to_datetime(df[column], format=format))
+    if not times.is_monotonic_increasing:
+        order = np.argsort(times.asi8, kind='stable')
+        df = df.take(order)
+        times = times[order]
+
+    # the index is left unnamed so groupby on the 'Time' column stays unambiguous
+    df = df.set_axis(times.rename(None)).assign(**{
+        column: times,
+        'Hour': times.hour,
+        'Month': times.month,
+        'Day': times.day,
+        'Year': times.year,
+        'Quarter': times.quarter,
+        'Date': times.normalize(),
+    })
+
+    offsets = {'day': period_offsets(times, 'D'), 'month': period_offsets(times, 'M')}
+    return df, offsets
+
+
+def period_offsets(times, freq):
+    # position of the first row of every period in a sorted DatetimeIndex
+    periods = times.to_period(freq)
+    codes = periods.asi8
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    return pd.Series(starts, index=periods[starts])
+
+
+def slice_periods(df, offsets, first, stop):
+    """
+    Rows from the start of period `first` up to, not including, the start of period `stop`.
+
+    Both ends are found by binary search in the precomputed offsets, and the result is a
+    positional slice of df rather than a masked copy.
+    """
+    keys = offsets.index
+    positions = np.append(offsets.to_numpy(), len(df))
+    return df.iloc[positions[keys.searchsorted(first)]:positions[keys.searchsorted(stop)]]
+
+
+def range_mask(df, ranges):
+    """
+    One boolean mask for several inclusive ranges.
+
+    Parameters:
+    - df: DataFrame to filter.
+    - ranges: dict of column -> (low, high).
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for column, (low, high) in ranges.items():
+        values = df[column].to_numpy()
+        mask &= (values >= low) & (values <= high)
+    return mask
+
+
+def aggregate(df, groupby, columns, operation, quantile=None, relative_accuracy=None):
+    # Mean, Max or PERCENTILE of each column per group, rounded to whole values;
+    # with relative_accuracy, percentiles are estimated from quantile sketches instead of sorting
+    if operation.lower() == 'percentile' and relative_accuracy:
+        sketches = quantilesketch.sketch_columns(df, groupby, columns, relative_accuracy)
+        table = pd.DataFrame({column: sketches[column].quantile(quantile) for column in columns}).sort_index()
+        return table.rename_axis(groupby).round(0)
+    grouped = df.groupby(groupby)[columns]
+    if operation.lower() == 'percentile':
+        return grouped.quantile(quantile).round(0)
+    return grouped.agg(operation.lower()).round(0)
+
+
+def quantile_label(q):
+    # 0.75 -> 'P75', 0.995 -> 'P99.5'
+    return f'P{q * 100:g}'
+
+
+def aggregate_many(df, groupby, columns, metrics=('Mean', 'Max'), quantiles=(), relative_accuracy=None):
+    """
+    Several statistics and percentiles of each column per group, in one pass per column.
+
+    Rows are put in group order once, then each group's values are sorted once per column; the
+    percentiles are read by position, and Max and Min are the group ends. Mean, Sum and Count come from bincounts.
+    Percentiles interpolate linearly like DataFrame.quantile and missing values are skipped.
+    With relative_accuracy, nothing is sorted: percentiles come from one quantile sketch per
+    column, within relative_accuracy of the exact values, and Max and Min from the sketch too.
+
+    Parameters:
+    - groupby: column to group by.
+    - columns: columns to aggregate.
+    - metrics: any of METRICS.
+    - quantiles: percentiles in [0, 1].
+    - relative_accuracy: e.g. 0.01 for approximate percentiles within 1%, None for exact ones.
+
+    Returns a table indexed by group with (column, statistic) MultiIndex columns, rounded to
+    whole values like aggregate.
+    """
+    codes, groups = pd.factorize(df[groupby], sort=True)
+    n_groups = len(groups)
+    statistics = list(metrics) + [quantile_label(q) for q in quantiles]
+
+    # rows in group order, shared by every column (the sketches take rows in any order)
+    by_group = np.argsort(codes, kind='stable') if not relative_accuracy else slice(None)
+    codes = codes[by_group]
+
+    results = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=float)[by_group]
+        valid = (codes >= 0) & ~np.isnan(values)
+        group, ordered = codes[valid], values[valid]
+
+        counts = np.bincount(group, minlength=n_groups)
+        sums = np.bincount(group, weights=ordered, minlength=n_groups)
+        empty = counts == 0
+        stats = {'Mean': np.where(empty, np.nan, sums / np.maximum(counts, 1)), 'Sum': sums, 'Count': counts}
+
+        if relative_accuracy:
+            sketch = quantilesketch.QuantileSketch.from_values(group, ordered, relative_accuracy)
+
+            def by_code(values):
+                # the sketch is indexed by the group codes present
+                return pd.Series(values, index=sketch.groups).reindex(np.arange(n_groups)).to_numpy()
+
+            stats['Max'] = by_code(sketch.max)
+            stats['Min'] = by_code(sketch.min)
+            for q in quantiles:
+                stats[quantile_label(q)] = by_code(sketch.quantile(q).to_numpy())
+        else:
+            # one in-place sort per group
+            starts = np.cumsum(counts) - counts
+            for start, count in zip(starts, counts):
+                ordered[start:start + count].sort()
+
+            def at(positions):
+                picked = ordered[np.minimum(positions, len(ordered) - 1)] if len(ordered) else np.zeros(n_groups)
+                return np.where(empty, np.nan, picked)
+
+            stats['Max'] = at(np.maximum(starts + counts - 1, 0))
+            stats['Min'] = at(starts)
+            for q in quantiles:
+                position = (counts - 1).clip(min=0) * q
+                low = np.floor(position).astype(np.int64)
+                high = np.minimum(low + 1, (counts - 1).clip(min=0))
+                stats[quantile_label(q)] = at(starts + low) + (at(starts + high) - at(starts + low)) * (position - low)
+
+        for statistic in statistics:
+            results[(column, statistic)] = stats[statistic]
+
+    table = pd.DataFrame(results, index=pd.Index(groups, name=groupby))
+    table.columns = pd.MultiIndex.from_tuples(table.columns, names=['Column', 'Statistic'])
+    return table.round(0)
+
+
+def _hhmm(minutes):
+    # minutes since midnight as HH:MM, 1440 as 24:00
+    return [f'{minute // 60:02d}:{minute % 60:02d}' for minute in np.asarray(minutes, dtype=np.int64)]
+
+
+def reading_interval(times):
+    # most common gap between consecutive readings, in whole minutes
+    minutes = np.unique((pd.DatetimeIndex(times) - pd.Timestamp(0)) // pd.Timedelta(minutes=1))
+    gaps = np.diff(minutes)
+    gaps = gaps[gaps > 0]
+    if len(gaps) == 0:
+        return 1
+    values, counts = np.unique(gaps, return_counts=True)
+    return int(values[counts.argmax()])
+
+
+def day_minute_matrix(df, columns, step=None, column='Time'):
+    """
+    Flows reshaped into a days × bins × columns array, every day from the first to the last
+    date with `step`-minute bins (a reading counts for the bin its timestamp falls in).
+
+    Parameters:
+    - df: DataFrame with a datetime column.
+    - columns: flow columns to sum into the bins.
+    - step: bin width in minutes (default: the most common gap between readings); must divide 1440.
+    - column: the datetime column.
+
+    Returns (flows, observed, days, step) where observed counts the readings of each cell
+    (missing flows are not counted) and days is a DatetimeIndex of the dates.
+    """
+    times = pd.DatetimeIndex(df[column])
+    step = step or reading_interval(times)
+    if 1440 % step:
+        raise ValueError(f'The bin width must divide a day, {step} minutes does not')
+    n_bins = 1440 // step
+
+    dates = times.normalize()
+    first = dates.min()
+    day = ((dates - first) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64)
+    minute = ((times - dates) // pd.Timedelta(minutes=1)).to_numpy(dtype=np.int64)
+    days = pd.date_range(first, dates.max(), freq='D')
+
+    # one bincount over (day, bin, column) cells, like peakcore.bin_matrix
+    values = df[columns].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    cells = ((day * n_bins + minute // step)[:, None] * len(columns) + np.arange(len(columns))).ravel()
+    size = len(days) * n_bins * len(columns)
+    flows = np.bincount(cells, weights=np.where(present, values, 0).ravel(), minlength=size)
+    observed = np.bincount(cells, weights=present.ravel(), minlength=size)
+    shape = (len(days), n_bins, len(columns))
+    return flows.reshape(shape), observed.reshape(shape), days, step
+
+
+def sliding_sums(flows, observed, bins):
+    """
+    Sums over every run of `bins` consecutive bins of each day, for all days and columns at once.
+
+    Windows start at every bin and end within the day; windows with an empty bin are NaN.
+    Returns an array of days × (bins per day - bins + 1) × columns.
+    """
+    csum = np.concatenate([np.zeros_like(flows[:, :1]), np.cumsum(flows, axis=1)], axis=1)
+    filled = np.concatenate([np.zeros_like(observed[:, :1]), np.cumsum(observed > 0, axis=1)], axis=1)
+    sums = csum[:, bins:] - csum[:, :-bins]
+    return np.where(filled[:, bins:] - filled[:, :-bins] == bins, sums, np.nan)
+
+
+def daily_peaks(df, columns, window=60, step=None, column='Time'):
+    """
+    Peak sliding-window flow of every day and column, e.g. the busiest 60 minutes even when
+    they span two calendar hours.
+
+    Returns a DataFrame with Date, Column, Peak, Start and End (HH:MM), one row per day and
+    column with at least one complete window.
+    """
+    flows, observed, days, step = day_minute_matrix(df, columns, step, column)
+    if window % step:
+        raise ValueError(f'The window must be a multiple of the {step} minute reading interval')
+    sums = sliding_sums(flows, observed, window // step)
+
+    complete = ~np.isnan(sums)
+    first_max = np.where(complete, sums, -np.inf).argmax(axis=1)
+    peak = np.take_along_axis(sums, first_max[:, None, :], axis=1)[:, 0, :]
+    has_peak = complete.any(axis=1)
+
+    day_index, column_index = np.nonzero(has_peak)
+    start = first_max[day_index, column_index] * step
+    return pd.DataFrame({
+        'Date': days[day_index],
+        'Column': np.asarray(columns, dtype=object)[column_index],
+        'Peak': np.round(peak[day_index, column_index]),
+        'Start': _hhmm(start),
+        'End': _hhmm(start + window),
+    })
+
+
+def daily_peak_percentiles(peaks, quantiles=STATS_QUANTILES):
+    # distribution of the daily peaks of each column: days, mean, percentiles and the busiest day
+    grouped = peaks.groupby('Column', sort=False)['Peak']
+    table = pd.DataFrame({'Days': grouped.size(), 'Mean': grouped.mean()})
+    for q in quantiles:
+        table[quantile_label(q)] = grouped.quantile(q)
+    busiest = peaks.loc[grouped.idxmax()].set_index('Column')
+    table['Max'] = busiest['Peak']
+    table['Max Date'] = busiest['Date'].dt.date
+    table['Max Start'] = busiest['Start']
+    return table.round({'Mean': 0, 'Max': 0, **{quantile_label(q): 0 for q in quantiles}})
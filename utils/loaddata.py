@@ -1,10 +1,107 @@
+import csv
+import hashlib
+import io
 import pandas as pd
 import streamlit as st
+from . import summarystats, sharedframe, resultcache
+
+# Map delimiter choice to actual delimiter
+DELIMITER_OPTIONS = {
+    'Comma (`,`)': ',',
+    'Semicolon (`;`)': ';',
+    'Tab (`\\t`)': '\t'
+}
+
+# how much of the file is read to detect the format
+SNIFF_BYTES = 8192
+
+
+def file_key(uploaded_file):
+    # cheap identity for an uploaded file, used instead of hashing its content on every rerun
+    return (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, 'file_id', None))
+
+
+def sniff_format(raw, sample_size=SNIFF_BYTES):
+    """
+    Detect delimiter, header presence and column count from the first few kilobytes of a file.
+
+    Parameters:
+    - raw: file content as bytes.
+    - sample_size: number of bytes to look at.
+
+    Returns (delimiter, has_header, n_columns).
+    """
+    lines = raw[:sample_size].decode('utf-8', errors='replace').splitlines()
+    # the last line of the sample may be cut in the middle
+    if len(raw) > sample_size and len(lines) > 1:
+        lines = lines[:-1]
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return ',', False, 0
+    sample = '\n'.join(lines)
+
+    sniffer = csv.Sniffer()
+    try:
+        delimiter = sniffer.sniff(sample, delimiters=''.join(DELIMITER_OPTIONS.values())).delimiter
+    except csv.Error:
+        # fall back to the delimiter that splits every line into the same, largest number of fields
+        counts = {d: {line.count(d) for line in lines} for d in DELIMITER_OPTIONS.values()}
+        consistent = [d for d, c in counts.items() if len(c) == 1 and min(c) > 0]
+        delimiter = max(consistent, key=lambda d: lines[0].count(d)) if consistent else ','
+
+    try:
+        has_header = sniffer.has_header(sample) if len(lines) > 1 else False
+    except csv.Error:
+        has_header = False
+
+    n_columns = len(next(csv.reader([lines[0]], delimiter=delimiter)))
+    return delimiter, has_header, n_columns
+
 
 @st.cache_data
-def load_data(uploaded_file, header_option, delimiter):
-    # Use header=None if the user wants to provide column names manually
-    if header_option == "No":
-        return pd.read_csv(uploaded_file, header=None, delimiter=delimiter)
+def detect_format(_raw, key):
+    return sniff_format(_raw)
+
+
+def use_copy_on_write():
+    # derived frames share the columns of the frame they come from until one of them writes
+    # (always on from pandas 3.0). Set by the app pages, load_data relies on it.
+    if int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option('mode.copy_on_write', True)
+
+
+@st.cache_resource(max_entries=8)
+def parse_csv(_raw, key, header_option, delimiter):
+    # parse from the raw bytes, so changing the settings never re-reads the upload stream.
+    # The parsed frame is shared by every rerun and session and must never be modified:
+    # load_data hands out copy-on-write views of it.
+    # With IGANALYSIS_SHARED_DIR set, the frame is also published to other processes (another
+    # app server, batch workers) by content, and parsed only by the first of them.
+    def read():
+        # Use header=None if the user wants to provide column names manually
+        if header_option == "No":
+            return pd.read_csv(io.BytesIO(_raw), header=None, delimiter=delimiter)
+        else:
+            return pd.read_csv(io.BytesIO(_raw), delimiter=delimiter)
+
+    if not sharedframe.SHARED_DIR:
+        df = read()
     else:
-        return pd.read_csv(uploaded_file, delimiter=delimiter)
\ No newline at end of file
+        name = sharedframe.frame_name(hashlib.blake2b(_raw, digest_size=16).hexdigest(), header_option, delimiter)
+        df = sharedframe.process_frame(name, read)
+    # read-only, and hashed once per load: cached results are then looked up for the views of
+    # every rerun without hashing the data again
+    resultcache.dataset_fingerprint(resultcache.read_only(df))
+    return df
+
+
+@st.cache_data
+def summarize_csv(_raw, key, header_option, delimiter):
+    # summary statistics computed once per file and format, streaming the file in chunks
+    summaries = summarystats.summarize_csv(io.BytesIO(_raw), header=None if header_option == "No" else 'infer', delimiter=delimiter)
+    return summarystats.summary_table(summaries), {column: summary.histogram() for column, summary in summaries.items()}
+
+
+def load_data(uploaded_file, header_option, delimiter):
+    # a shallow copy: renaming columns or adding derived ones does not touch the shared frame
+    return parse_csv(uploaded_file.getvalue(), file_key(uploaded_file), header_option, delimiter).copy(deep=False)
@@ -0,0 +1,118 @@
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Memory ledger for the frames each session holds at each stage of its pipeline. Frames
+# derived with copy-on-write share buffers with the frame they came from, so bytes are
+# counted per underlying buffer: a stage only adds the buffers no earlier stage holds.
+
+
+def _root(array):
+    # the array owning the memory a view points into
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def buffers(df):
+    """
+    Memory buffers behind the columns of df, as a dict key -> bytes.
+
+    Views into the same NumPy array or Arrow buffer have the same key, so frames sharing
+    data through copy-on-write share keys. Python objects referenced from object columns
+    are not counted.
+    """
+    found = {}
+    for _, column in df.items():
+        values = column.array
+        chunked = getattr(values, '_pa_array', None)
+        if chunked is not None:
+            # Arrow-backed columns (strings in pandas 3): the chunks' buffers
+            for chunk in chunked.chunks:
+                for buffer in chunk.buffers():
+                    if buffer is not None:
+                        found[('arrow', buffer.address, buffer.size)] = buffer.size
+            continue
+        array = column.to_numpy(copy=False) if isinstance(column.dtype, np.dtype) else None
+        if array is not None:
+            root = _root(array)
+            found[('numpy', root.__array_interface__['data'][0], root.nbytes)] = root.nbytes
+        else:
+            # other extension arrays are counted as a whole
+            found[('array', id(values))] = int(values.nbytes)
+    return found
+
+
+class _SessionToken:
+    pass
+
+
+class MemoryLedger:
+    """
+    Bytes held per session and stage.
+
+    Frames are referenced weakly, so recording a stage never keeps its frame alive; stages whose
+    frame was released are reported as such.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def record(self, session, stage, df):
+        # remember df as the frame of this session's stage, replacing the one from an earlier run; returns df
+        entry = (weakref.ref(df), buffers(df), df.shape)
+        with self._lock:
+            self._sessions.setdefault(session, OrderedDict())[stage] = entry
+        return df
+
+    def forget(self, session):
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def session_token(self, session):
+        """
+        Object whose lifetime stands for the session's: once it is garbage collected, the
+        session's stages are forgotten. Keep it in the session's own state (st.session_state),
+        which is dropped when the session ends.
+        """
+        token = _SessionToken()
+        weakref.finalize(token, self.forget, session)
+        return token
+
+    def report(self, session=None):
+        """
+        One row per session and stage with Rows, Columns, Bytes (all buffers the stage's frame
+        references) and New Bytes (buffers not held by an earlier live stage of the session).
+        """
+        with self._lock:
+            sessions = {session: self._sessions.get(session, {})} if session is not None else dict(self._sessions)
+            sessions = {name: list(stages.items()) for name, stages in sessions.items()}
+
+        rows = []
+        for name, stages in sessions.items():
+            seen = set()
+            for stage, (ref, found, shape) in stages:
+                alive = ref() is not None
+                new = {key: size for key, size in found.items() if key not in seen} if alive else {}
+                if alive:
+                    seen.update(found)
+                rows.append([name, stage, shape[0], shape[1], sum(found.values()), sum(new.values()), alive])
+        return pd.DataFrame(rows, columns=['Session', 'Stage', 'Rows', 'Columns', 'Bytes', 'New Bytes', 'Alive'])
+
+    def held_bytes(self, session=None):
+        # bytes of the distinct buffers held by the live stages of a session, or of all sessions
+        with self._lock:
+            sessions = [self._sessions.get(session, {})] if session is not None else list(self._sessions.values())
+            entries = [entry for stages in sessions for entry in stages.values()]
+        held = {}
+        for ref, found, _ in entries:
+            if ref() is not None:
+                held.update(found)
+        return sum(held.values())
+
+
+# process-wide ledger shared by all sessions
+ledger = MemoryLedger()
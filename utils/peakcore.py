@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+# Pure peak computations. Only pandas and NumPy are imported here so that batch
+# workers and services can use the math without loading the UI stack.
+# Rendering lives in peakrolling.py.
+
+MINUTES_PER_DAY = 1440
+
+# entity name used when rows are counted instead of summing a column
+ROW_COUNT = 'Rows'
+
+
+def minutes_to_hhmm(minutes):
+    # convert minutes (0-1440) to HH:MM format
+    return str(timedelta(minutes=int(minutes)))[:-3]
+
+
+def column_list(columns):
+    # None, a single column name or a list of column names -> list of column names
+    if columns is None:
+        return []
+    if isinstance(columns, str):
+        return [columns]
+    return list(columns)
+
+
+# entity columns accept the same forms
+entity_list = column_list
+
+
+def group_ids(df, groupBy=None):
+    """
+    Integer group id of every row for one or more key columns, factorized once.
+
+    Parameters:
+    - df: DataFrame to group.
+    - groupBy: column name, list of column names, or None for a single group.
+
+    Returns (ids, groups) where ids are numbered in order of first appearance (-1 for rows
+    with a missing key) and groups is an Index of key values (a MultiIndex for several keys).
+    """
+    keys = column_list(groupBy)
+    if not keys:
+        return np.zeros(len(df), dtype=np.int64), pd.Index([None])
+    if len(keys) == 1:
+        ids, groups = pd.factorize(df[keys[0]])
+        return ids, groups.rename(keys[0])
+
+    # factorize each key, then the combination of the key codes
+    codes, uniques = zip(*(pd.factorize(df[key]) for key in keys))
+    shape = [len(unique) for unique in uniques]
+    valid = np.all([code >= 0 for code in codes], axis=0)
+    combined = np.ravel_multi_index([code[valid] for code in codes], shape)
+
+    ids = np.full(len(df), -1, dtype=np.int64)
+    ids[valid], first = pd.factorize(combined)
+    groups = pd.MultiIndex.from_arrays([unique.take(code) for unique, code in zip(uniques, np.unravel_index(first, shape))], names=keys)
+    return ids, groups
+
+
+def bin_codes(times, bin_interval=1):
+    """
+    Bin number of each time (0 to 1440 minutes, at bin_interval granularity), -1 outside the day.
+
+    Same bins as pd.cut(times, bins=range(0, 1441, bin_interval), right=False).
+
+    Returns (codes, n_bins).
+    """
+    n_bins = MINUTES_PER_DAY // bin_interval
+    times = np.asarray(times, dtype=float)
+    valid = (times >= 0) & (times < n_bins * bin_interval)
+    codes = np.full(len(times), -1, dtype=np.int64)
+    codes[valid] = (times[valid] // bin_interval).astype(np.int64)
+    return codes, n_bins
+
+
+def bin_matrix(df, timeColumn, entityColumns=None, bin_interval=1, groupBy=None):
+    """
+    Sum every entity column into time bins for every group, from one shared binning.
+
+    Parameters:
+    - df: DataFrame with one row per passenger (or other entity).
+    - timeColumn: column with times in minutes (0-1440).
+    - entityColumns: column name, list of column names, or None to count rows.
+    - bin_interval: bin width in minutes.
+    - groupBy: column or list of key columns to group by, or None for all rows.
+
+    Returns (matrix, groups, entities) where matrix has shape groups × bins × entities
+    and groups is an Index (MultiIndex for several keys) of group values in order of appearance.
+    """
+    codes, n_bins = bin_codes(df[timeColumn].to_numpy(), bin_interval)
+    entities = entity_list(entityColumns)
+    ids, groups = group_ids(df, groupBy)
+
+    valid = (codes >= 0) & (ids >= 0)
+    if entities:
+        # NaN entities count as 0, like groupby().sum()
+        weights = np.nan_to_num(df[entities].to_numpy(dtype=float)[valid])
+    else:
+        weights = np.ones((int(valid.sum()), 1))
+        entities = [ROW_COUNT]
+
+    # one bincount over (group, bin, entity) cells fills the whole matrix
+    n_groups, n_entities = len(groups), len(entities)
+    cells = ids[valid] * n_bins + codes[valid]
+    flat = (cells[:, None] * n_entities + np.arange(n_entities)).ravel()
+    matrix = np.bincount(flat, weights=weights.ravel(), minlength=n_groups * n_bins * n_entities)
+    return matrix.reshape(n_groups, n_bins, n_entities), groups, entities
+
+
+def rolling_sums(matrix, window, min_periods=None):
+    """
+    Rolling sums over the bins axis of a groups × bins × entities matrix, for all columns at once.
+
+    Follows pandas rolling(window, min_periods).sum(): windows with fewer than min_periods
+    bins (default: window) are NaN.
+    """
+    n_bins = matrix.shape[1]
+    min_periods = window if min_periods is None else min_periods
+
+    csum = np.concatenate([np.zeros_like(matrix[:, :1]), np.cumsum(matrix, axis=1)], axis=1)
+    start = np.maximum(np.arange(n_bins) + 1 - window, 0)
+    sums = csum[:, 1:] - csum[:, start]
+    sums[:, np.arange(n_bins) + 1 - start < min_periods] = np.nan
+    return sums
+
+
+def peak_table(rolling, groups, entities, bin_interval=1, groupBy=None, show_in_hhmm_format=False):
+    """
+    Rolling max and the bin start time where it first occurs, one row per group and entity.
+    """
+    missing = np.isnan(rolling)
+    first_max = np.where(missing, -np.inf, rolling).argmax(axis=1)
+    rolling_max = np.take_along_axis(rolling, first_max[:, None, :], axis=1)[:, 0, :]
+    no_peak = missing.all(axis=1)
+
+    times = (first_max * bin_interval).astype(object)
+    if show_in_hhmm_format:
+        times = np.vectorize(minutes_to_hhmm, otypes=[object])(first_max * bin_interval)
+    times[no_peak] = 'N/A'
+
+    table = pd.DataFrame({
+        'Entity': np.tile(entities, len(groups)),
+        'RollingMax': np.where(no_peak, 0, rolling_max).astype(np.int64).ravel(),
+        'RollingMaxTime': times.ravel(),
+    })
+    if groupBy:
+        # one column per key
+        keys = groups.repeat(len(entities)).to_frame(index=False)
+        table = pd.concat([keys, table], axis=1)
+    return table
+
+
+def rolling_frame(rolling, groups, entities, bin_interval=1, groupBy=None):
+    # rolling sums as a DataFrame indexed by bin start time, one column per (group, entity)
+    times = pd.Index(np.arange(rolling.shape[1]) * bin_interval, name='Time')
+    values = rolling.transpose(1, 0, 2).reshape(rolling.shape[1], -1)
+    if groupBy:
+        levels = [groups.get_level_values(i).repeat(len(entities)) for i in range(groups.nlevels)]
+        columns = pd.MultiIndex.from_arrays(levels + [np.tile(entities, len(groups))], names=list(groups.names) + ['Entity'])
+    else:
+        columns = pd.Index(entities, name='Entity')
+    return pd.DataFrame(values, index=times, columns=columns)
+
+
+def rolling_peaks(df, timeColumn, entityColumns=None, bin_interval=1, window=60, groupBy=None, show_in_hhmm_format=False,
+                  min_periods=None):
+    """
+    Rolling peaks of several entity columns (or of row counts), optionally per group.
+
+    groupBy may be a single column or a list of key columns. All entities and groups share
+    one binning and one column-wise rolling pass.
+
+    Returns (peaks, rolling_sums):
+    - peaks: one row per group and entity with RollingMax and RollingMaxTime.
+    - rolling_sums: DataFrame indexed by bin start time with one column per (group, entity).
+    """
+    matrix, groups, entities = bin_matrix(df, timeColumn, entityColumns, bin_interval, groupBy)
+    rolling = rolling_sums(matrix, window, min_periods)
+    peaks = peak_table(rolling, groups, entities, bin_interval, groupBy, show_in_hhmm_format)
+    return peaks, rolling_frame(rolling, groups, entities, bin_interval, groupBy)
+
+
+def bin_sums(df, timeColumn, entityColumn, bin_interval=1):
+    """
+    Sum the entity column into time bins (0 to 1440 minutes, at bin_interval granularity).
+
+    Returns a Series indexed by the left edge of each bin (named 'Time').
+    """
+    matrix, _, _ = bin_matrix(df, timeColumn, entityColumn, bin_interval)
+    return pd.Series(matrix[0, :, 0], index=pd.Index(np.arange(matrix.shape[1]) * bin_interval, name='Time'), name=entityColumn)
+
+
+def rolling_bin_max_sum(df, timeColumn, entityColumn, bin_interval=1, window=60, show_in_hhmm_format=False):
+    """
+    Rolling peak of the entity column over all rows.
+
+    Returns (rolling_max, rolling_max_time, rolling_sum) where rolling_sum is the
+    full rolling series indexed by bin start time.
+    """
+    peaks, rolling = rolling_peaks(df, timeColumn, entityColumn, bin_interval=bin_interval, window=window,
+                                   show_in_hhmm_format=show_in_hhmm_format)
+    return int(peaks['RollingMax'].iloc[0]), peaks['RollingMaxTime'].iloc[0], rolling.iloc[:, 0].rename('Rolling Sum')
+
+
+def rolling_bin_max_sum_grouped(df, timeColumn, entityColumn, bin_interval=1, window=60, groupBy='', show_in_hhmm_format=False):
+    """
+    Rolling peak of the entity column for each value of the groupBy column (or each combination
+    of a list of key columns).
+
+    Returns (results, rolling_sums):
+    - results: DataFrame with PaxType (the key columns for several), RollingMax and RollingMaxTime per group.
+    - rolling_sums: DataFrame indexed by bin start time with one rolling sum column per group.
+    """
+    matrix, groups, entities = bin_matrix(df, timeColumn, entityColumn, bin_interval, groupBy)
+
+    # partial windows at the start of the day count for the peak, the chart uses full windows
+    results = peak_table(rolling_sums(matrix, window, min_periods=1), groups, entities, bin_interval, groupBy, show_in_hhmm_format)
+    results = results.drop(columns='Entity')
+    if isinstance(groupBy, str):
+        results = results.rename(columns={groupBy: 'PaxType'})
+
+    rolling = rolling_frame(rolling_sums(matrix, window), groups, entities, bin_interval, groupBy)
+    return results, rolling.droplevel('Entity', axis=1)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from . import peakcore, peakstats
+
+# Attribution of peak windows to the flights and airlines whose passengers fall in them.
+# Rows are indexed once by (group, arrival time), so the passengers of a window are a
+# binary-search range of that index instead of a scan of the whole frame.
+
+# flight columns of the Simio Input Generator passenger files
+FLIGHT_COLUMNS = ['AirlineIdx', 'DepFlightNumber', 'FlightDepTime']
+AIRLINE_COLUMNS = ['AirlineIdx']
+
+
+def arrival_index(df, timeColumn, groupBy=None):
+    """
+    Index of the rows of df sorted by group and arrival time.
+
+    Parameters:
+    - df: DataFrame with one row per passenger.
+    - timeColumn: column with arrival times in minutes.
+    - groupBy: column or list of key columns the peaks are grouped by, or None.
+
+    Returns (order, ids, times, groups): row positions in (group, time) order, the sorted
+    group ids and times, and the group key values as returned by peakcore.group_ids.
+    """
+    ids, groups = peakcore.group_ids(df, groupBy)
+    times = df[timeColumn].to_numpy(dtype=float)
+    order = np.lexsort((times, ids))
+    return order, ids[order], times[order], groups
+
+
+def window_rows(index, group, start, stop):
+    # row positions of group with start <= time < stop, two binary searches
+    order, ids, times, _ = index
+    first, last = np.searchsorted(ids, [group, group + 1])
+    low, high = np.searchsorted(times[first:last], [start, stop]) + first
+    return order[low:high]
+
+
+def peak_window(peak_time, window=60, bin_interval=1):
+    """
+    Arrival time range [start, stop) of the rolling window reported at peak_time.
+
+    The rolling sum at a bin covers that bin and the window - 1 bins before it; the range is
+    clipped to the day, as times outside it are not binned.
+    """
+    start = max(peak_time - (window - 1) * bin_interval, 0)
+    stop = min(peak_time + bin_interval, peakcore.MINUTES_PER_DAY // bin_interval * bin_interval)
+    return start, stop
+
+
+def peak_contributors(df, timeColumn, peaks, window=60, bin_interval=1, groupBy=None, by=FLIGHT_COLUMNS, index=None):
+    """
+    Flights (or airlines) with passengers in each peak window, with their share of the peak.
+
+    Parameters:
+    - df: DataFrame the peaks were computed from.
+    - timeColumn: column with arrival times in minutes.
+    - peaks: peak table from peakcore.rolling_peaks, with the groupBy key columns, Entity,
+      RollingMax and RollingMaxTime (minutes or HH:MM).
+    - window, bin_interval: as used for the peaks.
+    - groupBy: key columns the peaks were grouped by, or None.
+    - by: columns identifying a contributor, e.g. FLIGHT_COLUMNS or AIRLINE_COLUMNS.
+    - index: arrival_index(df, timeColumn, groupBy), to reuse it across calls.
+
+    Returns one row per peak and contributor with the peak keys, Entity, WindowStart, WindowEnd,
+    the by columns, Contribution (entity sum or passenger rows) and Share (% of the window),
+    largest contributors first.
+    """
+    keys = peakcore.column_list(groupBy)
+    by = peakcore.column_list(by)
+    index = index if index is not None else arrival_index(df, timeColumn, groupBy)
+    groups = index[3]
+    peak_times = peakstats.to_minutes(peaks['RollingMaxTime']).to_numpy()
+
+    tables = []
+    for (_, peak), peak_time in zip(peaks.iterrows(), peak_times):
+        if np.isnan(peak_time):
+            # no peak for this group and entity
+            continue
+        group = groups.get_loc(tuple(peak[keys]) if len(keys) > 1 else peak[keys[0]]) if keys else 0
+        start, stop = peak_window(peak_time, window, bin_interval)
+        rows = df.iloc[window_rows(index, group, start, stop)]
+
+        entity = peak.get('Entity', peakcore.ROW_COUNT)
+        if entity == peakcore.ROW_COUNT:
+            weights = pd.Series(1, index=rows.index)
+        else:
+            # NaN entities count as 0, like the peak sums
+            weights = rows[entity].fillna(0)
+
+        table = weights.groupby([rows[column] for column in by], sort=False, dropna=False).sum()
+        table = table.sort_values(ascending=False, kind='stable').rename('Contribution').reset_index()
+        table['Share'] = table['Contribution'] / table['Contribution'].sum() * 100
+        table.insert(0, 'WindowEnd', stop)
+        table.insert(0, 'WindowStart', start)
+        table.insert(0, 'Entity', entity)
+        # a key that is also a by column is there already, with the peak's value on every row
+        for position, key in enumerate([key for key in keys if key not in by]):
+            table.insert(position, key, peak[key])
+        tables.append(table)
+
+    if not tables:
+        return pd.DataFrame(columns=[key for key in keys if key not in by] + ['Entity', 'WindowStart', 'WindowEnd'] + by
+                            + ['Contribution', 'Share'])
+    return pd.concat(tables, ignore_index=True)
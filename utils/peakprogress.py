@@ -0,0 +1,137 @@
+import time
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from . import peakcore
+
+# Progressive peaks: estimates from growing row samples first, the exact peaks last.
+# Rows are split into RESIDUES classes by position (row i is in class i % RESIDUES),
+# and a sample is a random set of classes: a systematic sample, so time-sorted files are
+# covered over the whole day from the first stage on. Each stage bins only the classes
+# it adds, so all samples together cost at most a quarter pass over the data. Classes are dealt
+# round-robin into REPLICATES replicate samples, and the spread of the peak window sum
+# between replicates gives the standard error shown with every estimate.
+
+# latency target for the first estimate, in seconds
+BUDGET_SECONDS = 0.2
+
+RESIDUES = 1024
+REPLICATES = 8
+
+# smaller frames are computed exactly right away
+MIN_ROWS = 200_000
+
+# the last sample stage covers this fraction of the rows, the exact pass follows
+MAX_SAMPLE_FRACTION = 0.25
+
+
+def _add(stack, groups, chunk, chunk_groups, replicate):
+    # add a chunk's groups × bins × entities matrix to one replicate, growing the group axis for new groups
+    new = chunk_groups[~chunk_groups.isin(groups)]
+    if len(new):
+        groups = groups.append(new) if len(groups) else new
+        stack = np.concatenate([stack, np.zeros((stack.shape[0], len(new)) + stack.shape[2:])], axis=1)
+    stack[replicate, groups.get_indexer(chunk_groups)] += chunk
+    return stack, groups
+
+
+def _estimate(stack, residues, groups, entities, window, bin_interval, groupBy, min_periods, show_in_hhmm_format, z):
+    # peak table scaled from the sampled classes, with the replicate standard error of each peak window sum
+    n_replicates = stack.shape[0]
+    sampled = residues.sum()
+    rolling = peakcore.rolling_sums(stack.sum(axis=0) * RESIDUES / sampled, window, min_periods)
+    peaks = peakcore.peak_table(np.round(rolling), groups, entities, bin_interval, groupBy, show_in_hhmm_format)
+
+    # each replicate's own estimate of the window sum at the estimated peak bin
+    missing = np.isnan(rolling)
+    first_max = np.where(missing, -np.inf, rolling).argmax(axis=1)
+    replicate_rolling = peakcore.rolling_sums(stack.reshape((-1,) + stack.shape[2:]), window, min_periods).reshape(stack.shape)
+    at_peak = np.take_along_axis(replicate_rolling, first_max[None, :, None, :], axis=2)[:, :, 0, :]
+    estimates = np.nan_to_num(at_peak) * (RESIDUES / np.maximum(residues, 1))[:, None, None]
+    # random groups variance, with the finite population correction for the classes not sampled yet
+    std_error = np.sqrt(estimates.var(axis=0, ddof=1) / n_replicates * (1 - sampled / RESIDUES))
+
+    peaks['StdError'] = std_error.ravel()
+    peaks['Lower'] = np.maximum(peaks['RollingMax'] - z * peaks['StdError'], 0)
+    peaks['Upper'] = peaks['RollingMax'] + z * peaks['StdError']
+    return peaks
+
+
+def progressive_peaks(df, timeColumn, entityColumns=None, bin_interval=1, window=60, groupBy=None, min_periods=None,
+                      show_in_hhmm_format=False, budget=BUDGET_SECONDS, confidence=0.95, seed=0, exact=None):
+    """
+    Rolling peaks as a stream of refinements, like peakcore.rolling_peaks but yielding early estimates.
+
+    The first estimate comes from as many rows as can be binned within `budget` seconds, each
+    further one from twice the rows up to a quarter of them, and the last result is the exact
+    peak table. Frames under MIN_ROWS rows only yield the exact table.
+
+    Parameters:
+    - df, timeColumn, entityColumns, bin_interval, window, groupBy, min_periods, show_in_hhmm_format:
+      as for peakcore.rolling_peaks.
+    - budget: seconds until the first estimate.
+    - confidence: level of the Lower/Upper interval around each estimate.
+    - seed: random seed for the order in which rows are sampled.
+    - exact: function returning the exact peak table (default: peakcore.rolling_peaks), e.g. to
+      read it from a cache.
+
+    Yields (peaks, progress):
+    - peaks: peak table with StdError, Lower and Upper columns added (0 and RollingMax once exact).
+      Estimates are scaled sample sums; the maximum of noisy window sums leans high on small samples.
+    - progress: dict with stage, fraction of rows used, rows, elapsed seconds and exact.
+    """
+    start = time.perf_counter()
+    entities = peakcore.entity_list(entityColumns)
+    keys = peakcore.column_list(groupBy)
+    columns = list(dict.fromkeys([timeColumn] + entities + keys))
+    n = len(df)
+    stage = 0
+    frame = df[columns]
+
+    if n >= MIN_ROWS:
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        order = np.random.default_rng(seed).permutation(RESIDUES)
+        last = int(RESIDUES * MAX_SAMPLE_FRACTION)
+        stack, groups = None, pd.Index([])
+        residues = np.zeros(REPLICATES)
+        used, take = 0, REPLICATES
+        while used < last:
+            new = order[used:used + take]
+            for replicate in range(REPLICATES):
+                # classes are dealt to replicates by their place in the sampling order
+                mine = new[(used + np.arange(len(new))) % REPLICATES == replicate]
+                if not len(mine):
+                    continue
+                rows = np.sort(np.concatenate([np.arange(residue, n, RESIDUES) for residue in mine]))
+                chunk, chunk_groups, chunk_entities = peakcore.bin_matrix(frame.iloc[rows], timeColumn, entities or None,
+                                                                          bin_interval, groupBy)
+                if stack is None:
+                    stack = np.zeros((REPLICATES, 0) + chunk.shape[1:])
+                stack, groups = _add(stack, groups, chunk, chunk_groups, replicate)
+                residues[replicate] += len(mine)
+            used += len(new)
+            elapsed = time.perf_counter() - start
+
+            if stage == 0 and used == len(new):
+                # first pass timed: grow the sample to what fits the budget before the first estimate
+                per_class = elapsed / used
+                take = min(last - used, int(max(budget - elapsed, 0) / per_class))
+                if take > 0:
+                    continue
+            stage += 1
+            peaks = _estimate(stack, residues, groups, chunk_entities, window, bin_interval, groupBy, min_periods,
+                              show_in_hhmm_format, z)
+            yield peaks, {'stage': stage, 'fraction': used / RESIDUES, 'rows': int(n * used / RESIDUES),
+                          'elapsed': time.perf_counter() - start, 'exact': False}
+            if last - used < used:
+                # too few rows left to sample for a better estimate, go exact
+                break
+            take = used
+
+    if exact is None:
+        peaks = peakcore.rolling_peaks(df, timeColumn, entityColumns, bin_interval, window, groupBy, show_in_hhmm_format,
+                                       min_periods)[0]
+    else:
+        peaks = exact()
+    peaks = peaks.assign(StdError=0.0, Lower=peaks['RollingMax'], Upper=peaks['RollingMax'])
+    yield peaks, {'stage': stage + 1, 'fraction': 1.0, 'rows': n, 'elapsed': time.perf_counter() - start, 'exact': True}
@@ -1,127 +1,142 @@
-import streamlit as st
 import pandas as pd
-from datetime import timedelta
-import matplotlib.pyplot as plt
-import plotly.express as px
-import plotly.graph_objects as go
-
-def rolling_sum_of_rows(df, colT1, window=60):
-    # if colE2 not selected, count num of rows (rolling)
-    # for example, if colE2 is not selected, count the number of rows in the rolling window based on colT1
-    df['RollingSum'] = df[colT1].rolling(window=window).sum()
-    return df
-    
-def rolling_bin_max_sum_grouped(df, timeColumn, entityColumn, bin_interval=1, window=60, groupBy='', show_in_hhmm_format=False):
-    # Create bins for the given time column (0 to 1440 minutes, at bin_interval granularity)
-    bins = pd.cut(df[timeColumn], bins=range(0, 1441, bin_interval), right=False)
+from . import peakcore, peakflights, peakprogress, resultcache
 
-    # Dictionary to store results for each PaxType
-    results = {'PaxType': [], 'RollingMax': [], 'RollingMaxTime': []}
-    
-    # Iterate through each unique PaxType (groupBy category)
-    for pax_type in df[groupBy].unique():
-        temp_pax_type = df[df[groupBy] == pax_type]
+# Rendering layer for the peak computations in peakcore.py. Streamlit and plotly
+# are imported inside the functions that draw, so importing this module (or
+# peakcore directly) does not pull in the UI stack.
 
-        # Group by the time bins and sum the entity column within each bin
-        grpSizeSum = temp_pax_type.groupby(bins, observed=False)[entityColumn].sum()
 
-        # Calculate rolling sum and rolling max over the window
-        rolling_sum = grpSizeSum.rolling(window=min(window, len(grpSizeSum)), min_periods=1).sum()  # Ensure rolling doesn't fail on small windows
-        rolling_max = rolling_sum.max()
-        rolling_max_time = rolling_sum.idxmax()
+def plot_rolling_sums(rolling_sums, title='Rolling Sum for Multiple Pax Types'):
+    """
+    Build a plotly figure with one line per column of rolling_sums and a marker on each maximum.
+    """
+    import plotly.graph_objects as go
 
-        # Check if the rolling sum is not empty
-        if pd.notna(rolling_max_time):
-            rolling_max_time_value = rolling_max_time.left  # Extract the left side of the interval
-        else:
-            rolling_max_time_value = None
+    fig = go.Figure()
 
-        # Convert rolling max time to HH:MM format if required
-        if show_in_hhmm_format and rolling_max_time_value is not None:
-            rolling_max_time_value = str(timedelta(minutes=int(rolling_max_time_value)))[:-3]
+    for pax_type, rolling_sum in rolling_sums.items():
+        # Find max values
+        rolling_sum_max = rolling_sum.max()
+        rolling_sum_max_time = rolling_sum.idxmax()
 
-        # Append results for this PaxType
-        results['PaxType'].append(pax_type)
-        results['RollingMax'].append(int(rolling_max) if pd.notna(rolling_max) else 0)
-        results['RollingMaxTime'].append(rolling_max_time_value if rolling_max_time_value is not None else 'N/A')
+        # Add line plot for current pax_type
+        fig.add_trace(go.Scatter(x=rolling_sum.index, y=rolling_sum.values, mode='lines', name=f'{pax_type}'))
 
-    # fig, ax = plt.subplots()
+        # Add scatter plot to mark the max value
+        fig.add_trace(go.Scatter(x=[rolling_sum_max_time], y=[rolling_sum_max], mode='markers',
+                                 name=f'{rolling_sum_max}', marker=dict(color='red')))
 
+    # Set the title and layout of the figure
+    fig.update_layout(title=title,
+                      xaxis_title='Time',
+                      yaxis_title='Rolling Sum')
+    return fig
+
+
+def rolling_peaks(df, timeColumn, entityColumns=None, bin_interval=1, window=60, groupBy=None, show_in_hhmm_format=False,
+                  min_periods=None, progressive=False):
+    """
+    Show rolling peaks of several entity columns (or row counts when None), optionally per group
+    of one or more key columns, as a chart and a table with one row per group and entity.
+    With progressive, estimates from row samples are shown while the exact peaks are computed.
+    Returns the table.
+    """
+    import streamlit as st
+
+    entities = peakcore.entity_list(entityColumns)
+    keys = peakcore.column_list(groupBy)
+
+    columns = [timeColumn] + entities + keys
+    params = dict(timeColumn=timeColumn, entityColumns=entities or None, bin_interval=bin_interval, window=window,
+                  groupBy=groupBy, show_in_hhmm_format=show_in_hhmm_format, min_periods=min_periods)
+
+    def compute():
+        return resultcache.cached_call(peakcore.rolling_peaks, df, columns, **params)
+
+    # estimates only while the exact peaks are not in the cache yet
+    if progressive and len(df) >= peakprogress.MIN_ROWS and not resultcache.is_cached(peakcore.rolling_peaks, df, columns, **params):
+        estimate = st.empty()
+        for partial, progress in peakprogress.progressive_peaks(df, timeColumn, entities or None, bin_interval, window, groupBy,
+                                                                min_periods, show_in_hhmm_format, exact=lambda: compute()[0]):
+            if progress['exact']:
+                break
+            with estimate.container():
+                st.caption(f"Estimate from {progress['fraction']:.0%} of the rows after {progress['elapsed']:.2f} s, "
+                           'with a 95% interval (Lower - Upper); computing the exact peaks...')
+                st.dataframe(partial)
+        estimate.empty()
+    peaks, rolling_sums = compute()
+
+    # one line per (group, entity), named 'group entity'
+    if isinstance(rolling_sums.columns, pd.MultiIndex):
+        rolling_sums = rolling_sums.set_axis([' '.join(map(str, column)) for column in rolling_sums.columns], axis=1)
 
+    colPlot1, colDataShow = st.columns(2)
+    with colPlot1:
+        st.plotly_chart(plot_rolling_sums(rolling_sums, title='Rolling Sum'))
 
-    # Initialize the figure outside the loop
-    fig = go.Figure()
+    with colDataShow:
+        st.write(peaks)
 
-    # Loop through each unique pax_type
-    for pax_type in df[groupBy].unique():
-        temp_pax_type = df[df[groupBy] == pax_type]
-        grpSizeSum = temp_pax_type.groupby(bins, observed=False)[entityColumn].sum()
-        rolling_sum_chart = grpSizeSum.rolling(window).sum()
-        rolling_sum_chart.index = rolling_sum_chart.index.map(lambda x: x.left)
-        rolling_sum_df = rolling_sum_chart.reset_index()
-        rolling_sum_df.columns = ['Time', 'Rolling Sum']
+    return peaks
 
-        # Find max values
-        rolling_sum_max = rolling_sum_df['Rolling Sum'].max()
-        rolling_sum_max_time = rolling_sum_df[rolling_sum_df['Rolling Sum'] == rolling_sum_max]['Time'].iloc[0]
 
-        # Add line plot for current pax_type
-        fig.add_trace(go.Scatter(x=rolling_sum_df['Time'], y=rolling_sum_df['Rolling Sum'], mode='lines', name=f'{pax_type}'))
+def peak_contributors(df, timeColumn, peaks, window=60, bin_interval=1, groupBy=None):
+    """
+    Show the airlines and flights with passengers in each peak window of peaks, when df has
+    the flight columns. Returns the flight table, or None.
+    """
+    import streamlit as st
 
-        # Add scatter plot to mark the max value
-        fig.add_trace(go.Scatter(x=[rolling_sum_max_time], y=[rolling_sum_max], mode='markers', 
-                                name=f'{rolling_sum_max}', marker=dict(color='red')))
-        
-    # ax.set_xlabel('Time')
-    # ax.set_ylabel('Rolling Sum')
-    # ax.legend(title='PaxType')
-    # ax.set_title('Rolling Sum for Each PaxType')
-
-    # plotly
-    # fig.update_layout(title='Rolling Sum for Each PaxType', xaxis_title='Time', yaxis_title='Rolling Sum')
-    # Set the title and layout of the figure
-    fig.update_layout(title='Rolling Sum for Multiple Pax Types',
-                    xaxis_title='Time',
-                    yaxis_title='Rolling Sum')
+    by = [column for column in peakflights.FLIGHT_COLUMNS if column in df.columns]
+    if not by:
+        return None
+
+    # the (group, time) index is built once per dataset and shared through the result cache
+    keys = peakcore.column_list(groupBy)
+    index = resultcache.cached_call(peakflights.arrival_index, df, [timeColumn] + keys, timeColumn=timeColumn, groupBy=groupBy)
+    airlines = [column for column in peakflights.AIRLINE_COLUMNS if column in by]
+    flights = peakflights.peak_contributors(df, timeColumn, peaks, window, bin_interval, groupBy, by=by, index=index)
+
+    with st.expander('Flights in the peak windows'):
+        if airlines:
+            st.write('Airlines')
+            st.dataframe(peakflights.peak_contributors(df, timeColumn, peaks, window, bin_interval, groupBy, by=airlines, index=index))
+        st.write('Flights')
+        st.dataframe(flights)
+
+    return flights
+
+
+def rolling_bin_max_sum_grouped(df, timeColumn, entityColumn, bin_interval=1, window=60, groupBy='', show_in_hhmm_format=False):
+    import streamlit as st
+
+    # results are shared through the result cache, so the same request from any session is not recomputed
+    results, rolling_sums = resultcache.cached_call(peakcore.rolling_bin_max_sum_grouped, df, [timeColumn, entityColumn, groupBy],
+                                                    timeColumn=timeColumn, entityColumn=entityColumn, bin_interval=bin_interval,
+                                                    window=window, groupBy=groupBy, show_in_hhmm_format=show_in_hhmm_format)
 
     # show on left side of the screen
     colPlot1, colDataShow = st.columns(2)
     with colPlot1:
-        # st.pyplot(fig)
-        st.plotly_chart(fig)
+        st.plotly_chart(plot_rolling_sums(rolling_sums))
 
     with colDataShow:
-        st.write(pd.DataFrame(results))
-
+        st.write(results)
 
     # Return the final dataframe
-    return pd.DataFrame(results, columns=['PaxType', 'RollingMax', 'RollingMaxTime'])
+    return results
 
-def rolling_bin_max_sum(df, timeColumn, entityColumn, bin_interval=1, window=60, show_in_hhmm_format=False):
-    temp = df.copy()
-    bins = pd.cut(temp[timeColumn], bins=range(0, 1441, bin_interval), right=False)
-    
-    grpSizeSum = temp.groupby(bins, observed=False)[entityColumn].sum()
 
+def rolling_bin_max_sum(df, timeColumn, entityColumn, bin_interval=1, window=60, show_in_hhmm_format=False):
+    import streamlit as st
 
-    # Calculate rolling max of x-minute intervals
-    rolling_sum = grpSizeSum.rolling(window).sum()
-    rolling_max = rolling_sum.max()
-    rolling_max_time = rolling_sum.idxmax()
+    rolling_max, rolling_max_time, rolling_sum = resultcache.cached_call(peakcore.rolling_bin_max_sum, df, [timeColumn, entityColumn],
+                                                                         timeColumn=timeColumn, entityColumn=entityColumn,
+                                                                         bin_interval=bin_interval, window=window,
+                                                                         show_in_hhmm_format=show_in_hhmm_format)
 
     # plot
-    rolling_sum_chart = rolling_sum.copy()
-    rolling_sum_chart.index = rolling_sum.index.map(lambda x: x.left)
-    rolling_sum_df = rolling_sum_chart.reset_index()    
-    rolling_sum_df.columns = ['Time', 'Rolling Sum']
-    st.line_chart(rolling_sum_df.set_index('Time')['Rolling Sum'])
-
-    if show_in_hhmm_format:
-        # convert to HH:MM format
-        rolling_max_time_in_hhmm = str(timedelta(minutes=int(rolling_max_time.left)))[:-3]
-
-        return int(rolling_max), rolling_max_time_in_hhmm
-    else:
+    st.line_chart(rolling_sum)
 
-        rolling_max_time = rolling_max_time.left
-        return int(rolling_max), rolling_max_time
+    return rolling_max, rolling_max_time
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+# Bootstrap confidence intervals for peak statistics across replications. All resamples
+# are drawn as one index matrix, and because the resampled values are gathered from
+# sorted replication values, every resample comes out already sorted: percentiles are
+# read by position without sorting per resample.
+
+# statistics reported by default: the mean and these percentiles of the per-replication peaks
+DEFAULT_STATISTICS = ('mean', 0.5, 0.9, 0.95)
+
+# upper bound for groups × resamples × replications values gathered at once
+MAX_BATCH_VALUES = 50_000_000
+
+
+def to_minutes(values):
+    # peak times as minutes, also when they are in HH:MM format
+    values = pd.Series(values)
+    if not pd.api.types.is_numeric_dtype(values):
+        text = values.astype(str)
+        hhmm = text.str.contains(':', regex=False)
+        parts = text[hhmm].str.split(':', expand=True)
+        minutes = pd.to_numeric(values.where(~hhmm), errors='coerce')
+        if hhmm.any():
+            minutes[hhmm] = parts[0].astype(float) * 60 + parts[1].astype(float)
+        return minutes.astype(float)
+    return values.astype(float)
+
+
+def _sorted_quantile(sorted_values, q):
+    # linear-interpolated quantile of values sorted along the last axis (numpy's default method)
+    position = (sorted_values.shape[-1] - 1) * q
+    low = int(np.floor(position))
+    high = min(low + 1, sorted_values.shape[-1] - 1)
+    return sorted_values[..., low] + (sorted_values[..., high] - sorted_values[..., low]) * (position - low)
+
+
+def _statistic(sorted_values, statistic):
+    if statistic == 'mean':
+        return sorted_values.mean(axis=-1)
+    return _sorted_quantile(sorted_values, float(statistic))
+
+
+def bootstrap(values, statistics=DEFAULT_STATISTICS, n_resamples=10000, confidence=0.95, seed=None):
+    """
+    Bootstrap percentile confidence intervals for several groups with the same number of replications.
+
+    Parameters:
+    - values: array of shape groups × replications.
+    - statistics: 'mean' and/or quantiles in [0, 1].
+    - n_resamples: number of bootstrap resamples.
+    - confidence: confidence level of the intervals.
+    - seed: random seed, for reproducible intervals.
+
+    Returns a dict statistic -> (estimate, lower, upper), each an array with one value per group.
+    """
+    values = np.sort(np.asarray(values, dtype=float), axis=1)
+    n_groups, n_reps = values.shape
+
+    # one sorted index matrix serves every group and statistic
+    rng = np.random.default_rng(seed)
+    resamples = np.sort(rng.integers(0, n_reps, size=(n_resamples, n_reps)), axis=1)
+
+    boot = {statistic: np.empty((n_groups, n_resamples)) for statistic in statistics}
+    step = max(1, MAX_BATCH_VALUES // max(1, n_resamples * n_reps))
+    for start in range(0, n_groups, step):
+        # groups × resamples × replications, sorted along the last axis
+        samples = values[start:start + step][:, resamples]
+        for statistic in statistics:
+            boot[statistic][start:start + step] = _statistic(samples, statistic)
+
+    alpha = (1 - confidence) / 2
+    result = {}
+    for statistic in statistics:
+        estimate = _statistic(values, statistic)
+        lower, upper = np.quantile(boot[statistic], [alpha, 1 - alpha], axis=1)
+        result[statistic] = (estimate, lower, upper)
+    return result
+
+
+def peak_confidence_intervals(peaks, groupBy=None, valueColumns=('RollingMax', 'RollingMaxTime'), statistics=DEFAULT_STATISTICS,
+                              n_resamples=10000, confidence=0.95, seed=None):
+    """
+    Confidence intervals of peak statistics across replications, per group.
+
+    Parameters:
+    - peaks: per-replication peak table with one row per replication and group, e.g. the
+      reset_index() of batch.get_peaks results. Peak times may be minutes or HH:MM.
+    - groupBy: column or list of columns identifying a group (e.g. 'PaxType', or
+      ['PaxType', 'Window'] for several windows), or None when each row is a replication.
+    - valueColumns: peak value columns to report on.
+
+    Returns a table with one row per group, value and statistic: Estimate, Lower and Upper bounds
+    and the number of replications.
+    """
+    keys = [groupBy] if isinstance(groupBy, str) else list(groupBy or [])
+    values = pd.DataFrame({column: to_minutes(peaks[column]).to_numpy() for column in valueColumns}, index=peaks.index)
+    if keys:
+        values[keys] = peaks[keys]
+        groups = values.groupby(keys, sort=False, dropna=False)
+    else:
+        groups = [((), values)]
+
+    # groups with the same number of replications are resampled together
+    by_size = {}
+    for key, group in groups:
+        for column in valueColumns:
+            sample = group[column].dropna().to_numpy()
+            if len(sample) > 0:
+                by_size.setdefault(len(sample), []).append((key, column, sample))
+
+    rows = []
+    for size, entries in by_size.items():
+        result = bootstrap(np.stack([sample for _, _, sample in entries]), statistics, n_resamples, confidence, seed)
+        for i, (key, column, _) in enumerate(entries):
+            key = key if isinstance(key, tuple) else (key,)
+            for statistic, (estimate, lower, upper) in result.items():
+                label = statistic if statistic == 'mean' else f'p{float(statistic) * 100:g}'
+                rows.append(list(key) + [column, label, estimate[i], lower[i], upper[i], size])
+
+    return pd.DataFrame(rows, columns=keys + ['Value', 'Statistic', 'Estimate', 'Lower', 'Upper', 'Replications'])
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+# Mergeable quantile sketches with a relative error guarantee (DDSketch-style). Values
+# are counted in logarithmic buckets: bucket k holds values in (gamma**(k-1), gamma**k]
+# with gamma = (1 + a) / (1 - a), so answering with the bucket's midpoint is within a
+# relative error a of the true value. The sketches of all groups of a column are one
+# dense count matrix filled by a single bincount, and two sketches merge by adding counts.
+
+RELATIVE_ACCURACY = 0.01
+
+# values closer to zero than this are counted as zero
+MIN_INDEXABLE = 1e-9
+
+
+class QuantileSketch:
+    """
+    Quantile sketches of one value column for a set of groups.
+
+    Estimated quantiles are within relative_accuracy of the exact quantile (for values of mixed
+    sign, within relative_accuracy of the largest absolute value involved). Min, max and count
+    are exact.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.groups = pd.Index([])
+        # bucket counts, groups × keys starting at offset, for positive and (mirrored) negative values
+        self.offset = 0
+        self.positive = np.zeros((0, 0), dtype=np.int64)
+        self.negative = np.zeros((0, 0), dtype=np.int64)
+        self.zeros = np.zeros(0, dtype=np.int64)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+
+    @classmethod
+    def from_values(cls, groups, values, relative_accuracy=RELATIVE_ACCURACY):
+        return cls(relative_accuracy).update(groups, values)
+
+    def _key(self, magnitudes):
+        return np.ceil(np.log(magnitudes) / np.log(self.gamma)).astype(np.int64)
+
+    def _value(self, keys):
+        # the value every member of bucket k is estimated by
+        return 2 * self.gamma ** keys / (self.gamma + 1)
+
+    def update(self, groups, values):
+        """
+        Add values with their group labels (arrays of the same length); missing values are skipped.
+        """
+        values = np.asarray(values, dtype=float)
+        codes, uniques = pd.factorize(np.asarray(groups))
+        valid = (codes >= 0) & ~np.isnan(values)
+        codes, values = codes[valid], values[valid]
+
+        chunk = QuantileSketch(self.relative_accuracy)
+        n_groups = len(uniques)
+        chunk.groups = pd.Index(uniques)
+        chunk.zeros = np.bincount(codes[np.abs(values) < MIN_INDEXABLE], minlength=n_groups)
+        chunk.min = np.full(n_groups, np.inf)
+        chunk.max = np.full(n_groups, -np.inf)
+        np.minimum.at(chunk.min, codes, values)
+        np.maximum.at(chunk.max, codes, values)
+
+        positive, negative = values >= MIN_INDEXABLE, values <= -MIN_INDEXABLE
+        keys = self._key(np.abs(values[positive | negative]))
+        chunk.offset = int(keys.min()) if len(keys) else 0
+        width = int(keys.max()) - chunk.offset + 1 if len(keys) else 0
+        for sign, name in ((positive, 'positive'), (negative, 'negative')):
+            cells = codes[sign] * width + self._key(np.abs(values[sign])) - chunk.offset
+            setattr(chunk, name, np.bincount(cells, minlength=n_groups * width).reshape(n_groups, width))
+        return self.merge(chunk)
+
+    def merge(self, other):
+        # add the counts of another sketch of the same column, e.g. from another file or date range
+        if other.gamma != self.gamma:
+            raise ValueError('Sketches with different relative accuracies cannot be merged')
+        groups = self.groups.union(other.groups, sort=False) if len(self.groups) else other.groups
+        # key range covering both
+        spans = [(sketch.offset, sketch.offset + sketch.positive.shape[1]) for sketch in (self, other) if sketch.positive.shape[1]]
+        low = min(start for start, _ in spans) if spans else 0
+        high = max(stop for _, stop in spans) if spans else 0
+
+        merged = QuantileSketch(self.relative_accuracy)
+        merged.groups = groups
+        merged.offset = low
+        merged.positive = np.zeros((len(groups), high - low), dtype=np.int64)
+        merged.negative = np.zeros((len(groups), high - low), dtype=np.int64)
+        merged.zeros = np.zeros(len(groups), dtype=np.int64)
+        merged.min = np.full(len(groups), np.inf)
+        merged.max = np.full(len(groups), -np.inf)
+        for sketch in (self, other):
+            if len(sketch.groups) == 0:
+                continue
+            rows = groups.get_indexer(sketch.groups)
+            if sketch.positive.shape[1]:
+                columns = slice(sketch.offset - low, sketch.offset - low + sketch.positive.shape[1])
+                merged.positive[rows, columns] += sketch.positive
+                merged.negative[rows, columns] += sketch.negative
+            merged.zeros[rows] += sketch.zeros
+            merged.min[rows] = np.minimum(merged.min[rows], sketch.min)
+            merged.max[rows] = np.maximum(merged.max[rows], sketch.max)
+        self.__dict__.update(merged.__dict__)
+        return self
+
+    def count(self):
+        return pd.Series(self.positive.sum(axis=1) + self.negative.sum(axis=1) + self.zeros, index=self.groups)
+
+    def quantile(self, q):
+        """
+        Estimated q-quantile of every group, interpolated between order statistics like
+        DataFrame.quantile. Returns a Series indexed by group (NaN for empty groups).
+        """
+        # all buckets of a group in value order: negatives from the most negative, zero, positives
+        counts = np.concatenate([self.negative[:, ::-1], self.zeros[:, None], self.positive], axis=1)
+        keys = self.offset + np.arange(self.positive.shape[1])
+        values = np.concatenate([-self._value(keys[::-1]), [0.0], self._value(keys)])
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1] if cumulative.shape[1] else np.zeros(len(self.groups), dtype=np.int64)
+
+        position = np.maximum(total - 1, 0) * q
+        low, high = np.floor(position), np.ceil(position)
+
+        def at(rank):
+            # value of the bucket holding the order statistic of this rank
+            bucket = np.minimum((cumulative <= rank[:, None]).sum(axis=1), len(values) - 1)
+            return np.clip(values[bucket], self.min, self.max)
+
+        with np.errstate(invalid='ignore'):
+            # empty groups give inf - inf, masked below
+            estimate = at(low) + (at(high) - at(low)) * (position - low)
+        return pd.Series(np.where(total > 0, estimate, np.nan), index=self.groups)
+
+    @property
+    def nbytes(self):
+        return self.positive.nbytes + self.negative.nbytes + self.zeros.nbytes + self.min.nbytes + self.max.nbytes
+
+
+def sketch_columns(df, groupby, columns, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    One sketch per column for the groups of groupby (None for a single group), in one pass.
+
+    Returns a dict column -> QuantileSketch.
+    """
+    groups = df[groupby].to_numpy() if groupby is not None else np.zeros(len(df), dtype=np.int64)
+    return {column: QuantileSketch.from_values(groups, df[column], relative_accuracy) for column in columns}
@@ -0,0 +1,127 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Code -> group remapping tables (e.g. SSCPType -> PaxSPorPE). Tables are stored in a
+# JSON file so the apps and the batch path apply exactly the same rules, and they are
+# applied through a lookup array instead of a Python call per row.
+
+REMAP_FILE = os.environ.get('IGANALYSIS_REMAPS',
+                            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'remaps.json'))
+
+# lookup arrays are used for integer codes spanning at most this many values
+MAX_LOOKUP_SIZE = 1_000_000
+
+DEFAULT_REMAPS = {
+    'PaxSPorPE': {
+        'source': 'SSCPType',
+        # 1 Standard, 2 Priority -> 1 and 3 Precheck, 4 Employee -> 2
+        'mapping': [[1, 1], [2, 1], [3, 2], [4, 2]],
+        'default': 3,
+        'description': 'SSCPType is grouped into PaxSPorPE column with 1 Standard, 2 Priority grouped in 1 '
+                       'and 3 Precheck and 4 Employee grouped in 2, other codes in 3',
+    },
+}
+
+
+def load_remaps(path=None):
+    """
+    All stored remapping tables, with the built-in ones first.
+
+    Each table is a dict with 'source' (column to read), 'mapping' (list of [code, group] pairs),
+    'default' (group for codes not in the mapping) and 'description'.
+    """
+    remaps = dict(DEFAULT_REMAPS)
+    path = path or REMAP_FILE
+    if os.path.exists(path):
+        with open(path) as f:
+            remaps.update(json.load(f))
+    return remaps
+
+
+def save_remap(name, source, mapping, default=None, description='', path=None):
+    """
+    Store a remapping table under name, replacing a table with the same name.
+
+    Parameters:
+    - name: name of the new column, e.g. 'PaxSPorPE'.
+    - source: column with the codes, e.g. 'SSCPType'.
+    - mapping: dict or list of (code, group) pairs.
+    - default: group for codes not in the mapping (None leaves them empty).
+    """
+    path = path or REMAP_FILE
+    stored = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+
+    pairs = mapping.items() if isinstance(mapping, dict) else mapping
+    stored[name] = {
+        'source': source,
+        'mapping': [[_plain(code), _plain(group)] for code, group in pairs],
+        'default': _plain(default),
+        'description': description,
+    }
+    with open(path, 'w') as f:
+        json.dump(stored, f, indent=2)
+
+
+def delete_remap(name, path=None):
+    # remove a stored table; built-in tables come back with their default rules
+    path = path or REMAP_FILE
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        stored = json.load(f)
+    stored.pop(name, None)
+    with open(path, 'w') as f:
+        json.dump(stored, f, indent=2)
+
+
+def _plain(value):
+    # numpy scalars -> python values for JSON
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def apply_mapping(values, mapping, default=None):
+    """
+    Map every code in values to its group.
+
+    Integer codes go through a NumPy lookup array indexed by code; other codes through a
+    categorical recoding, so only the distinct codes are looked up.
+
+    Parameters:
+    - values: Series or array of codes.
+    - mapping: dict or list of (code, group) pairs.
+    - default: group for codes not in the mapping (None gives NaN).
+    """
+    mapping = dict(mapping.items() if isinstance(mapping, dict) else map(tuple, mapping))
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    default = np.nan if default is None else default
+
+    codes = values.to_numpy()
+    keys = np.array(list(mapping.keys()))
+    if codes.dtype.kind in 'iu' and keys.dtype.kind in 'iu' and len(codes) > 0:
+        low, high = min(codes.min(), keys.min()), max(codes.max(), keys.max())
+        if high - low < MAX_LOOKUP_SIZE:
+            # a Series infers the dtype like the categorical path does: strings with a missing default
+            # stay objects with NaN, where np.array would turn NaN into the string 'nan'
+            groups = pd.Series(list(mapping.values()) + [default]).to_numpy()
+            # lookup[code - low] is the position of the group in groups, unmapped codes point at default
+            lookup = np.full(high - low + 1, len(groups) - 1)
+            lookup[keys - low] = np.arange(len(keys))
+            return pd.Series(groups[lookup[codes - low]], index=values.index)
+
+    categorical = pd.Categorical(values)
+    groups = pd.Series([mapping.get(code, default) for code in categorical.categories] + [default])
+    # code -1 (missing value) picks the default at the end
+    return pd.Series(groups.to_numpy()[categorical.codes], index=values.index)
+
+
+def remap_column(df, name, remaps=None):
+    """
+    New column for the stored remapping table name, computed from its source column.
+    """
+    table = (remaps or load_remaps())[name]
+    return apply_mapping(df[table['source']], table['mapping'], table.get('default')).rename(name)
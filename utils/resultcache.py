@@ -0,0 +1,264 @@
+import hashlib
+import os
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# In-process cache for group-by and peak results. The module is imported once per
+# server process, so every Streamlit session (and every caller in a batch process)
+# shares the same cache.
+
+# memory budget, can be changed with the IGANALYSIS_CACHE_MB environment variable or configure()
+DEFAULT_MAX_MB = float(os.environ.get('IGANALYSIS_CACHE_MB', 512))
+
+
+# content hashes of column buffers, so a column is hashed once and not on every rerun:
+# buffer key -> (weak reference to the buffer's owner, digest)
+_column_digests = {}
+_digest_lock = threading.Lock()
+
+
+def _buffer_key(column):
+    """
+    Location of the memory behind a column, with an object owning it, or (None, None) when unknown
+    or when the memory can change.
+
+    Only buffers that cannot be written are located: Arrow arrays, and NumPy arrays that are
+    read-only (memory-mapped shared frames, frames passed to read_only()). A frame owning
+    writeable memory may be edited in place, which would keep its location.
+    """
+    if isinstance(column.dtype, np.dtype):
+        values = column.to_numpy(copy=False)
+        owner = values
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        if owner.flags.writeable:
+            return None, None
+        return ('numpy', values.__array_interface__['data'][0], values.shape, values.strides, values.dtype.str), owner
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # shared frames hold strings as categoricals: the codes' buffer, and the (short) categories by content
+        key, owner = _buffer_key(pd.Series(column.array.codes, copy=False))
+        if key is None:
+            return None, None
+        categories = pd.util.hash_pandas_object(column.cat.categories, index=False).to_numpy().tobytes()
+        return ('category', key, categories, column.cat.ordered), owner
+    chunked = getattr(column.array, '_pa_array', None)
+    if chunked is not None:
+        # Arrow buffers are immutable; shallow copies wrap the same buffers in new objects
+        buffers = tuple((chunk.offset, len(chunk)) + tuple((buffer.address, buffer.size) if buffer is not None else None
+                                                          for buffer in chunk.buffers()) for chunk in chunked.chunks)
+        return ('arrow', str(column.dtype), buffers), chunked
+    return None, None
+
+
+def read_only(df):
+    """
+    Make the NumPy memory of df read-only and return df, for frames that are shared and never
+    modified (e.g. a loaded file kept for all reruns), so their column hashes can be remembered.
+
+    Writing to df then raises; frames derived from it with copy-on-write copy a column when
+    they write to it.
+    """
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        values = column.array.codes if isinstance(column.dtype, pd.CategoricalDtype) else column.to_numpy(copy=False)
+        if not isinstance(values, np.ndarray):
+            continue
+        while isinstance(values.base, np.ndarray):
+            values = values.base
+        values.flags.writeable = False
+    return df
+
+
+def column_digest(column):
+    # content hash of one column, computed once per buffer
+    key, owner = _buffer_key(column)
+    if key is not None:
+        with _digest_lock:
+            entry = _column_digests.get(key)
+        # memory is only reused for other data once its owner is freed
+        if entry is not None and entry[0]() is not None:
+            return entry[1]
+
+    digest = hashlib.blake2b(pd.util.hash_pandas_object(column, index=False).to_numpy().tobytes(), digest_size=16).digest()
+    if key is not None:
+        try:
+            ref = weakref.ref(owner, lambda _, key=key: _forget_digest(key))
+        except TypeError:
+            return digest
+        with _digest_lock:
+            _column_digests[key] = (ref, digest)
+    return digest
+
+
+def _forget_digest(key):
+    with _digest_lock:
+        entry = _column_digests.get(key)
+        if entry is not None and entry[0]() is None:
+            del _column_digests[key]
+
+
+def dataset_fingerprint(df, columns=None):
+    """
+    Content hash of a DataFrame, or of only the given columns.
+
+    Hashing only the columns a computation reads keeps this cheap on wide frames and
+    makes the key independent of unrelated columns being added or renamed. Hashes of
+    columns that cannot change in place (see read_only) are remembered per buffer while the
+    frame holding it is alive, so once a loaded frame is fingerprinted, the views of it that
+    every rerun works on are not hashed again.
+    """
+    # columns are read from df by position, not through a selected copy: their buffers (and the
+    # Arrow arrays owning them) must be the frame's own for the remembered hashes to be found
+    positions = range(df.shape[1]) if columns is None else df.columns.get_indexer_for(list(dict.fromkeys(columns)))
+    if len(positions) and min(positions) < 0:
+        raise KeyError(f'{[c for c in columns if c not in df.columns]} not in the columns')
+    selected = [df.iloc[:, position] for position in positions]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(((len(df), len(selected)), [str(c.name) for c in selected], [str(c.dtype) for c in selected])).encode())
+    for column in selected:
+        digest.update(column_digest(column))
+    return digest.hexdigest()
+
+
+def size_of(value):
+    # approximate memory held by a cached value, in bytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(k) + size_of(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def freeze(value):
+    # turn lists, dicts and sets in parameters into hashable tuples
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, set):
+        return tuple(sorted(freeze(v) for v in value))
+    return value
+
+
+class ResultCache:
+    """
+    Least-recently-used cache bounded by the memory its values hold.
+
+    Values are shared between callers and must not be modified in place.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def __contains__(self, key):
+        # membership only: neither counted as a hit or miss nor marked as used
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value):
+        size = size_of(value)
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= self._entries.pop(key)[1]
+            # values larger than the whole budget are not kept
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.size_bytes += size
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.size_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _evict(self):
+        # drop least recently used entries until the budget is met (lock held by caller)
+        while self.size_bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size_bytes -= size
+            self.evictions += 1
+
+
+_MISSING = object()
+
+# cache shared by the whole process
+results = ResultCache(DEFAULT_MAX_MB * 1024 * 1024)
+
+
+def configure(max_mb):
+    # change the memory budget of the shared cache, evicting entries if needed
+    results.resize(max_mb * 1024 * 1024)
+
+
+def cached_call(func, df, columns, /, **params):
+    """
+    Call func(df, **params) through the shared cache.
+
+    Parameters:
+    - func: function taking the DataFrame as first argument.
+    - df: DataFrame to compute on.
+    - columns: columns of df that func reads; only these are fingerprinted.
+    - params: keyword arguments for func, part of the cache key. The first three parameters are
+      positional-only, so func may take its own `columns` (or `df`, `func`) keyword.
+    """
+    key = call_key(func, df, columns, **params)
+    return results.get_or_compute(key, lambda: func(df, **params))
+
+
+def call_key(func, df, columns, /, **params):
+    # cache key of cached_call(func, df, columns, **params)
+    return (func.__module__, func.__qualname__, dataset_fingerprint(df, columns), freeze(params))
+
+
+def is_cached(func, df, columns, /, **params):
+    # whether cached_call(func, df, columns, **params) would return a stored result, e.g. to skip
+    # showing estimates of it
+    return call_key(func, df, columns, **params) in results
@@ -0,0 +1,324 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from . import batch, hourcore, peakcore, resultcache
+
+# Headless HTTP/JSON service for the peak engine and the hour by hour aggregation, for
+# tools that do not go through the Streamlit apps. Datasets are loaded once and kept in
+# memory under their content fingerprint. Requests against the same dataset that arrive
+# together are answered from one vectorized pass: peaks share one binning over the union
+# of their entity columns, aggregations one aggregate_many over the union of their columns
+# and statistics.
+#
+# endpoints:
+#   POST /datasets   {"path", "kind": "csv" | "passengers", "header", "delimiter", "time_index"}
+#   GET  /datasets   loaded datasets
+#   POST /peaks      {"dataset", "timeColumn", "entityColumns", "window", "bin_interval", "groupBy",
+#                     "min_periods", "show_in_hhmm_format"}
+#   POST /aggregate  {"dataset", "groupby", "columns", "metrics", "quantiles", "relative_accuracy"}
+#   GET  /stats      latency percentiles and batching counters per endpoint
+
+DEFAULT_PORT = 8765
+
+# how long the first request of a batch waits for others to join, in seconds
+BATCH_WINDOW = 0.005
+
+# latencies kept per endpoint for the percentiles
+LATENCY_SAMPLES = 10000
+
+
+class DatasetStore:
+    """
+    Datasets kept warm in memory, by content fingerprint.
+
+    Loading the same file again (same path, size, mtime and options) returns the loaded dataset
+    without reading it.
+    """
+
+    def __init__(self):
+        self._datasets = {}
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def load(self, path, kind='csv', header=True, delimiter=',', time_index=False):
+        stat = os.stat(path)
+        path_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, kind, header, delimiter, time_index)
+        with self._lock:
+            if path_key in self._paths:
+                return self._paths[path_key]
+
+        if kind == 'passengers':
+            df = batch.read_passengers(path)
+        else:
+            df = pd.read_csv(path, header=0 if header else None, delimiter=delimiter)
+        if time_index:
+            # Hour, Month, Day... columns for the hour by hour aggregation
+            df, _ = hourcore.index_by_time(df)
+
+        dataset = resultcache.dataset_fingerprint(df)
+        with self._lock:
+            self._datasets.setdefault(dataset, df)
+            self._paths[path_key] = dataset
+        return dataset
+
+    def get(self, dataset):
+        with self._lock:
+            if dataset not in self._datasets:
+                raise KeyError(f"Unknown dataset '{dataset}', load it with POST /datasets first")
+            return self._datasets[dataset]
+
+    def describe(self):
+        with self._lock:
+            return [{'dataset': dataset, 'rows': len(df), 'columns': [str(c) for c in df.columns]} for dataset, df in self._datasets.items()]
+
+
+class Batcher:
+    """
+    Collects concurrent requests with the same key and answers them with one call of
+    run(key, params_list) -> results. The first request of a batch waits `window` seconds for
+    others, then computes for all of them; the others wait for their result.
+    """
+
+    def __init__(self, run, window=BATCH_WINDOW):
+        self.run = run
+        self.window = window
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, key, params):
+        slot = {'params': params, 'done': threading.Event()}
+        with self._lock:
+            pending = self._pending.setdefault(key, [])
+            pending.append(slot)
+            leader = len(pending) == 1
+
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                slots = self._pending.pop(key)
+                self.batches += 1
+                self.requests += len(slots)
+            self._run(key, slots)
+
+        slot['done'].wait()
+        if 'error' in slot:
+            raise slot['error']
+        return slot['result']
+
+    def _run(self, key, slots):
+        try:
+            results = self.run(key, [slot['params'] for slot in slots])
+            for slot, result in zip(slots, results):
+                slot['result'] = result
+        except Exception:
+            # one bad request fails the shared pass: answer each request on its own
+            for slot in slots:
+                try:
+                    slot['result'] = self.run(key, [slot['params']])[0]
+                except Exception as e:
+                    slot['error'] = e
+        finally:
+            for slot in slots:
+                slot['done'].set()
+
+
+def batched_peaks(df, timeColumn, bin_interval, groupBy, requests):
+    """
+    Peaks for several requests sharing the dataset, time column, bin interval and grouping.
+
+    One bin_matrix over the union of the requested entity columns, one rolling pass per distinct
+    (window, min_periods), then each request's entities are picked out of it.
+    """
+    entities = list(dict.fromkeys(entity for request in requests for entity in peakcore.entity_list(request.get('entityColumns'))))
+    matrix, groups, entities = peakcore.bin_matrix(df, timeColumn, entities or None, bin_interval, groupBy)
+
+    rolling = {}
+    results = []
+    for request in requests:
+        window, min_periods = request.get('window', 60), request.get('min_periods')
+        if (window, min_periods) not in rolling:
+            rolling[(window, min_periods)] = peakcore.rolling_sums(matrix, window, min_periods)
+        wanted = peakcore.entity_list(request.get('entityColumns')) or entities
+        picked = [entities.index(entity) for entity in wanted]
+        results.append(peakcore.peak_table(rolling[(window, min_periods)][:, :, picked], groups, wanted, bin_interval, groupBy,
+                                           request.get('show_in_hhmm_format', False)))
+    return results
+
+
+def batched_aggregates(df, groupby, relative_accuracy, requests):
+    """
+    Hour by hour tables for several requests sharing the dataset, grouping and accuracy, from
+    one aggregate_many over the union of their columns, metrics and quantiles.
+    """
+    columns = list(dict.fromkeys(column for request in requests for column in request['columns']))
+    metrics = list(dict.fromkeys(metric for request in requests for metric in request.get('metrics', ['Mean'])))
+    quantiles = sorted(set(q for request in requests for q in request.get('quantiles', [])))
+    table = hourcore.aggregate_many(df, groupby, columns, metrics, quantiles, relative_accuracy)
+
+    results = []
+    for request in requests:
+        statistics = request.get('metrics', ['Mean']) + [hourcore.quantile_label(q) for q in request.get('quantiles', [])]
+        results.append(table.loc[:, pd.MultiIndex.from_product([request['columns'], statistics])])
+    return results
+
+
+def _positive_int(request, name, default):
+    # a request parameter that must be a whole number of minutes or bins, checked before it reaches a batch
+    value = request.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f'{name} must be a positive integer, got {value!r}')
+    return value
+
+
+def _records(df):
+    # JSON-ready rows, NaN as null
+    return json.loads(df.to_json(orient='records'))
+
+
+def _split(df):
+    # JSON-ready table with (column, statistic) pairs as column labels
+    return json.loads(df.to_json(orient='split'))
+
+
+class PeakService:
+    """
+    The service state: warm datasets, batchers and latency counters. Handlers are plain
+    methods taking and returning JSON-ready dicts, so the service can be used without HTTP too.
+    """
+
+    def __init__(self, batch_window=BATCH_WINDOW):
+        self.datasets = DatasetStore()
+        self.peak_batcher = Batcher(self._run_peaks, batch_window)
+        self.aggregate_batcher = Batcher(self._run_aggregates, batch_window)
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self._lock = threading.Lock()
+
+    def _run_peaks(self, key, requests):
+        dataset, timeColumn, bin_interval, groupBy, _ = key
+        return batched_peaks(self.datasets.get(dataset), timeColumn, bin_interval, list(groupBy) or None, requests)
+
+    def _run_aggregates(self, key, requests):
+        dataset, groupby, relative_accuracy = key
+        return batched_aggregates(self.datasets.get(dataset), groupby, relative_accuracy, requests)
+
+    def load(self, request):
+        dataset = self.datasets.load(request['path'], request.get('kind', 'csv'), request.get('header', True),
+                                     request.get('delimiter', ','), request.get('time_index', False))
+        df = self.datasets.get(dataset)
+        return {'dataset': dataset, 'rows': len(df), 'columns': [str(c) for c in df.columns]}
+
+    def peaks(self, request):
+        for name, default in (('bin_interval', 1), ('window', 60)):
+            _positive_int(request, name, default)
+        # requests counting rows (no entity columns, None or []) and requests summing columns are binned separately
+        key = (request['dataset'], request['timeColumn'], request.get('bin_interval', 1),
+               tuple(peakcore.column_list(request.get('groupBy'))), bool(peakcore.entity_list(request.get('entityColumns'))))
+        return {'peaks': _records(self.peak_batcher.submit(key, request))}
+
+    def aggregate(self, request):
+        key = (request['dataset'], request['groupby'], request.get('relative_accuracy'))
+        return {'table': _split(self.aggregate_batcher.submit(key, request))}
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            self._latencies[endpoint].append(seconds)
+
+    def stats(self):
+        with self._lock:
+            latencies = {endpoint: np.array(samples) for endpoint, samples in self._latencies.items()}
+        report = {}
+        for endpoint, samples in latencies.items():
+            p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1000
+            report[endpoint] = {'requests': len(samples), 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': samples.max() * 1000}
+        for name, batcher in (('peaks', self.peak_batcher), ('aggregate', self.aggregate_batcher)):
+            report.setdefault(f'/{name}', {}).update({'batches': batcher.batches,
+                                                      'mean_batch_size': batcher.requests / batcher.batches if batcher.batches else 0})
+        return report
+
+
+def make_handler(service):
+    routes = {
+        ('GET', '/datasets'): lambda request: {'datasets': service.datasets.describe()},
+        ('GET', '/stats'): lambda request: service.stats(),
+        ('POST', '/datasets'): service.load,
+        ('POST', '/peaks'): service.peaks,
+        ('POST', '/aggregate'): service.aggregate,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self, method):
+            start = time.perf_counter()
+            route = routes.get((method, self.path))
+            if route is None:
+                return self._reply(404, {'error': f'No endpoint {method} {self.path}'})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length)) if length else {}
+                response = route(request)
+            except KeyError as e:
+                return self._reply(404 if 'Unknown dataset' in str(e) else 400, {'error': str(e).strip('"')})
+            except (ValueError, TypeError, FileNotFoundError) as e:
+                return self._reply(400, {'error': f'{type(e).__name__}: {e}'})
+            except Exception as e:
+                # always answer, so the client is not left with a dropped connection
+                return self._reply(500, {'error': f'{type(e).__name__}: {e}'})
+            self._reply(200, response)
+            service.record(self.path, time.perf_counter() - start)
+
+        def _reply(self, status, body):
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def log_message(self, format, *args):
+            # latencies are reported by /stats instead of one log line per request
+            pass
+
+    return Handler
+
+
+def make_server(host='127.0.0.1', port=DEFAULT_PORT, batch_window=BATCH_WINDOW):
+    """
+    HTTP server for a new PeakService (port 0 picks a free port); call serve_forever() on it,
+    e.g. in a thread for tests.
+    """
+    service = PeakService(batch_window)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP/JSON service for rolling peaks and hour by hour aggregation.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('--batch-window', type=float, default=BATCH_WINDOW, help='seconds a request waits for others to batch with')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.batch_window)
+    print(f'Serving on http://{args.host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
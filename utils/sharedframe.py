@@ -0,0 +1,290 @@
+import atexit
+import hashlib
+import os
+import threading
+import pickle
+import shutil
+import tempfile
+import uuid
+import numpy as np
+import pandas as pd
+
+# Loaded frames shared between processes as memory-mapped column files. A frame is
+# published once into a directory holding one .npy file per column and a manifest;
+# any process on the machine (another app server, a queue worker) attaches to it
+# read-only, and the operating system keeps one copy of the pages for all of them.
+# Frames attach without copying: NumPy columns map their .npy file and Arrow-backed columns
+# (strings in pandas 3) their Arrow IPC file directly, both keeping their dtype. Other columns
+# (object, other extension types) are stored as category codes and attach as categoricals,
+# with the categories sorted so grouping and sorting order them as before.
+#
+# Every process using a frame holds a lease file; releasing the last lease removes the
+# frame, and leases of processes that died are pruned by cleanup().
+#
+# layout:
+#   <root>/frames/<name>/manifest.pkl   column labels, index and how each column is stored
+#   <root>/frames/<name>/<i>.npy        column i, NumPy or category codes
+#   <root>/frames/<name>/<i>.arrow      column i, Arrow-backed
+#   <root>/leases/<name>/<pid>-<token>  one file per holder
+
+# shared directory, e.g. on a RAM-backed file system; empty disables sharing in the apps
+SHARED_DIR = os.environ.get('IGANALYSIS_SHARED_DIR', '')
+
+MANIFEST = 'manifest.pkl'
+
+# leases this process holds until it exits, (root, name) -> token
+_process_leases = {}
+_process_lock = threading.Lock()
+
+
+def default_root():
+    # /dev/shm keeps the pages in memory on Linux, elsewhere the temporary directory
+    if SHARED_DIR:
+        return SHARED_DIR
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'iganalysis-frames')
+
+
+def frame_name(*key):
+    # directory name for a dataset key, e.g. (file name, size, header option, delimiter)
+    return hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+
+
+def _frame_dir(root, name):
+    return os.path.join(root, 'frames', name)
+
+
+def _lease_dir(root, name):
+    return os.path.join(root, 'leases', name)
+
+
+def _encode(values):
+    # array to store for a column, and what attach needs to rebuild it: ('numpy', None),
+    # ('arrow', dtype) or ('category', categories)
+    if isinstance(values.dtype, np.dtype) and values.dtype != object:
+        return values.to_numpy(), ('numpy', None)
+    chunked = getattr(values.array, '_pa_array', None)
+    if chunked is not None:
+        return chunked, ('arrow', values.dtype)
+    try:
+        codes, categories = pd.factorize(values, sort=True)
+    except TypeError:
+        # values that cannot be compared with each other keep their order of appearance
+        codes, categories = pd.factorize(values)
+    return codes.astype(np.int32 if len(categories) < 2 ** 31 else np.int64), ('category', categories)
+
+
+def _write_arrow(path, chunked):
+    import pyarrow as pa
+
+    table = pa.table({'values': chunked})
+    with pa.OSFile(path, 'wb') as f, pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow(path, dtype):
+    # the column over the mapped file, in the column's own dtype
+    import pyarrow as pa
+
+    chunked = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all().column(0)
+    if isinstance(dtype, pd.StringDtype):
+        return pd.arrays.ArrowStringArray(chunked, dtype=dtype)
+    return pd.arrays.ArrowExtensionArray(chunked)
+
+
+def publish(df, name, root=None):
+    """
+    Write df as a shared frame. Returns False when a frame of that name exists already, which
+    is then left as it is: the name stands for the content.
+    """
+    root = root or default_root()
+    target = _frame_dir(root, name)
+    if os.path.isdir(target):
+        return False
+
+    # written under a private name and renamed, so nobody attaches to a partial frame
+    staging = f'{target}.{os.getpid()}-{uuid.uuid4().hex}.tmp'
+    os.makedirs(staging)
+    index = None if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1 else df.index
+    encodings = []
+    for position in range(df.shape[1]):
+        array, encoding = _encode(df.iloc[:, position])
+        if encoding[0] == 'arrow':
+            _write_arrow(os.path.join(staging, f'{position}.arrow'), array)
+        else:
+            np.save(os.path.join(staging, f'{position}.npy'), array, allow_pickle=False)
+        encodings.append(encoding)
+    with open(os.path.join(staging, MANIFEST), 'wb') as f:
+        pickle.dump({'columns': df.columns, 'encodings': encodings, 'index': index, 'rows': len(df)}, f)
+
+    try:
+        os.rename(staging, target)
+    except OSError:
+        # another process published the same frame first
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+    return True
+
+
+def attach(name, root=None):
+    """
+    The shared frame `name`, mapped read-only without copying. Raises FileNotFoundError when it
+    is not published.
+
+    Columns keep their dtype, except object and non-Arrow extension columns, which attach as
+    categoricals: writing a value that is not among a column's categories raises, replace the
+    whole column instead. Writing to the frame raises; derive frames with copy-on-write
+    (df.copy(deep=False)) instead.
+    """
+    folder = _frame_dir(root or default_root(), name)
+    with open(os.path.join(folder, MANIFEST), 'rb') as f:
+        manifest = pickle.load(f)
+    data = {}
+    for position, (kind, extra) in enumerate(manifest['encodings']):
+        if kind == 'arrow':
+            data[position] = _read_arrow(os.path.join(folder, f'{position}.arrow'), extra)
+            continue
+        # a plain ndarray view of the mapping, so results computed from it are not memmaps
+        array = np.asarray(np.load(os.path.join(folder, f'{position}.npy'), mmap_mode='r', allow_pickle=False))
+        data[position] = array if kind == 'numpy' else pd.Categorical.from_codes(array, dtype=pd.CategoricalDtype(extra))
+    # built by position, column labels may repeat
+    df = pd.DataFrame(data, index=manifest['index'] if manifest['index'] is not None else pd.RangeIndex(manifest['rows']), copy=False)
+    return df.set_axis(manifest['columns'], axis=1)
+
+
+def acquire(name, root=None):
+    # take a lease on a frame for this process, returns its token
+    folder = _lease_dir(root or default_root(), name)
+    os.makedirs(folder, exist_ok=True)
+    token = f'{os.getpid()}-{uuid.uuid4().hex}'
+    open(os.path.join(folder, token), 'w').close()
+    return token
+
+
+def release(name, token, root=None):
+    """
+    Give up a lease; the frame is removed with the last one.
+
+    Processes holding the frame mapped keep reading it after the files are removed (on POSIX
+    systems; elsewhere removal waits for the next cleanup).
+    """
+    root = root or default_root()
+    try:
+        os.remove(os.path.join(_lease_dir(root, name), token))
+    except FileNotFoundError:
+        pass
+    if not _leases(root, name):
+        _remove(root, name)
+
+
+def _leases(root, name):
+    folder = _lease_dir(root, name)
+    return os.listdir(folder) if os.path.isdir(folder) else []
+
+
+def _remove(root, name):
+    # rename first, so a process publishing the frame again never mixes with the old files
+    target = _frame_dir(root, name)
+    trash = f'{target}.{os.getpid()}-{uuid.uuid4().hex}.removed'
+    try:
+        os.rename(target, trash)
+    except OSError:
+        return
+    shutil.rmtree(trash, ignore_errors=True)
+    try:
+        os.rmdir(_lease_dir(root, name))
+    except OSError:
+        pass
+
+
+def _alive(pid):
+    if os.name == 'nt':
+        # os.kill would end the process on Windows; leases there are only removed by release()
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # exists but belongs to someone else, or the check is not supported
+        return True
+    return True
+
+
+def shared_frame(name, build, root=None):
+    """
+    Attach to the shared frame `name`, publishing build() under that name first when no
+    process has.
+
+    Returns (df, token); pass the token to release() when the frame is no longer used.
+    """
+    root = root or default_root()
+    token = acquire(name, root)
+    try:
+        return attach(name, root), token
+    except FileNotFoundError:
+        pass
+    publish(build(), name, root)
+    return attach(name, root), token
+
+
+def process_frame(name, build, root=None):
+    """
+    Like shared_frame, with one lease per process that is released when the process exits,
+    for frames kept in a process-wide cache.
+    """
+    root = root or default_root()
+    with _process_lock:
+        if (root, name) in _process_leases:
+            try:
+                return attach(name, root)
+            except FileNotFoundError:
+                # removed by a cleanup, publish it again
+                _process_leases.pop((root, name))
+        df, _process_leases[(root, name)] = shared_frame(name, build, root)
+    return df
+
+
+@atexit.register
+def _release_process_leases():
+    for (root, name), token in list(_process_leases.items()):
+        release(name, token, root)
+
+
+def status(root=None):
+    # published frames with their rows, size on disk and number of leases
+    root = root or default_root()
+    folder = os.path.join(root, 'frames')
+    rows = []
+    for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        path = os.path.join(folder, name)
+        if name.endswith(('.tmp', '.removed')):
+            continue
+        size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+        with open(os.path.join(path, MANIFEST), 'rb') as f:
+            manifest = pickle.load(f)
+        rows.append([name, manifest['rows'], len(manifest['columns']), size, len(_leases(root, name))])
+    return pd.DataFrame(rows, columns=['Name', 'Rows', 'Columns', 'Bytes', 'Leases'])
+
+
+def cleanup(root=None):
+    """
+    Prune leases of processes that are gone and remove frames nobody holds a lease on, e.g.
+    after workers were killed. Returns the names of the removed frames.
+    """
+    root = root or default_root()
+    folder = os.path.join(root, 'frames')
+    removed = []
+    for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        if name.endswith(('.tmp', '.removed')):
+            continue
+        for token in _leases(root, name):
+            if not _alive(int(token.split('-')[0])):
+                try:
+                    os.remove(os.path.join(_lease_dir(root, name), token))
+                except FileNotFoundError:
+                    pass
+        if not _leases(root, name):
+            _remove(root, name)
+            removed.append(name)
+    return removed
@@ -1,21 +1,73 @@
 import streamlit as st
-from . import loaddata
+import pandas as pd
+from . import loaddata, resultcache, export, remap, memledger, sortindex
+
+def select_format(newKey):
+    """
+    Show delimiter and header options, defaulting to the format detected from the start of the file,
+    and load the selected file with them.
+
+    Returns (df, header_option).
+    """
+    uploaded_file = st.session_state.selected_file
+    key = loaddata.file_key(uploaded_file)
+    detected_delimiter, detected_header, detected_columns = loaddata.detect_format(uploaded_file.getvalue(), key)
+
+    # widget keys include the file, so every new file starts from its detected format
+    fileKey = newKey + "-".join(map(str, key))
+    delimiter_labels = list(loaddata.DELIMITER_OPTIONS.keys())
+    delimiter = st.sidebar.radio('Select delimiter:', delimiter_labels, horizontal=True,
+                                 index=list(loaddata.DELIMITER_OPTIONS.values()).index(detected_delimiter),
+                                 key=fileKey+"delim")
+    delimiter = loaddata.DELIMITER_OPTIONS[delimiter]
+
+    header_option = st.sidebar.radio('Does the CSV file have Column Names?', ["No", "Yes"], horizontal=True,
+                                     index=1 if detected_header else 0, key=fileKey+"header")
+    st.sidebar.caption(f'Detected: delimiter `{detected_delimiter!r}`, column names `{"Yes" if detected_header else "No"}`, '
+                       f'`{detected_columns}` columns')
+
+    # the summary is read back with the same format
+    st.session_state.selected_format = (header_option, delimiter)
+    df = track('loaded', loaddata.load_data(uploaded_file, header_option, delimiter))
+    return df, header_option
+
+
+def show_summary(df):
+    """
+    Show summary statistics of the selected file, computed once per file and format, with a
+    histogram of a chosen column.
+    """
+    uploaded_file = st.session_state.selected_file
+    header_option, delimiter = st.session_state.selected_format
+    summary, histograms = loaddata.summarize_csv(uploaded_file.getvalue(), loaddata.file_key(uploaded_file), header_option, delimiter)
+
+    # the summary is of the file, show it under the current column names
+    summary = summary.set_axis(df.columns, axis=1) if len(df.columns) == summary.shape[1] else summary
+    st.write(summary)
+    st.caption('Percentiles are read from a histogram and are within one bin width of the exact values.')
+
+    # histograms are in the order of the columns
+    position = st.selectbox('Histogram of column:', range(summary.shape[1]), format_func=lambda i: str(summary.columns[i]),
+                            index=None, placeholder="Select column...")
+    if position is not None:
+        st.bar_chart(list(histograms.values())[position])
+
+
+def show_sorted(df, columns, ascending=True, page_rows=sortindex.PAGE_ROWS):
+    """
+    Show df sorted by columns one page at a time, read through a sort permutation cached per
+    dataset, columns and direction; only the shown page is copied.
+    """
+    order = sortindex.cached_order(df, columns, ascending)
+    page = st.number_input(f'Page (of {sortindex.pages(order, page_rows)}, {page_rows} rows each)', min_value=1,
+                           max_value=sortindex.pages(order, page_rows), value=1, step=1)
+    start = (page - 1) * page_rows
+    st.dataframe(track('sorted page', sortindex.take_sorted(df, order, start, start + page_rows)), use_container_width=True)
+    return order
+
 
 def sidebar(newKey):
-    # Delimiter selection option
-    delimiter = st.sidebar.radio('Select delimiter:', ['Comma (`,`)', 'Semicolon (`;`)', 'Tab (`\\t`)'], horizontal=True, key=newKey+"delim")
-
-    # Map delimiter choice to actual delimiter
-    delimiter_map = {
-        'Comma (`,`)': ',',
-        'Semicolon (`;`)': ';',
-        'Tab (`\\t`)': '\t'
-    }
-    delimiter = delimiter_map[delimiter]
-
-    header_option = st.sidebar.radio('Does the CSV file have Column Names?', ["No", "Yes"], horizontal=True, key=newKey+"header")
-    
-    df = loaddata.load_data(st.session_state.selected_file, header_option, delimiter)
+    df, header_option = select_format(newKey)
     
     if header_option == "Yes":
         st.session_state.now_show = True
@@ -36,7 +88,7 @@ def sidebar(newKey):
     # column length
     st.write('Number of columns: ', df.shape[1], 'Number of rows: ', df.shape[0])
     if st.checkbox('Show Summary (contains count, mean, std, min, max, etc. over each column)', key=newKey+"checkbox"):
-        st.write(df.describe())
+        show_summary(df)
         
     st.write('### Data Preview')
     tableElement = st.empty()
@@ -49,4 +101,85 @@ def sidebar(newKey):
     if "updated_column_names" not in st.session_state:
         st.session_state.updated_column_names = None
 
-    return df, header_option, tableElement
\ No newline at end of file
+    return df, header_option, tableElement
+
+
+def cache_stats():
+    # hit/miss and size counters of the result cache shared by all sessions
+    stats = resultcache.results.stats()
+    with st.sidebar.expander('Result cache'):
+        st.write(f"Entries: `{stats['entries']}`, size: `{stats['size_bytes'] / 2**20:.1f}` of `{stats['max_bytes'] / 2**20:.0f}` MB")
+        st.write(f"Hits: `{stats['hits']}`, misses: `{stats['misses']}`, evictions: `{stats['evictions']}`")
+
+
+def session_id():
+    # id of the current browser session, 'local' outside of a streamlit run
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+
+def track(stage, df):
+    # record df as this session's frame at stage in the memory ledger, returns df
+    session = session_id()
+    if 'memory_token' not in st.session_state:
+        # the session's entries are dropped with its state when it ends
+        st.session_state.memory_token = memledger.ledger.session_token(session)
+    return memledger.ledger.record(session, stage, df)
+
+
+def memory_stats():
+    # bytes held per stage of this session, shared buffers counted once
+    report = memledger.ledger.report(session_id())
+    with st.sidebar.expander('Memory'):
+        st.write(f"This session: `{memledger.ledger.held_bytes(session_id()) / 2**20:.1f}` MB, "
+                 f"all sessions: `{memledger.ledger.held_bytes() / 2**20:.1f}` MB")
+        st.dataframe(report.drop(columns='Session'), hide_index=True)
+
+
+def download_table(df, name, key, index=True):
+    # download a result table as csv, parquet or xlsx
+    formatCol, buttonCol = st.columns([1, 3])
+    with formatCol:
+        format = st.selectbox('Export format:', export.FORMATS, key=key+"format", label_visibility='collapsed')
+    with buttonCol:
+        st.download_button(f'Download {name}', data=export.table_bytes(df, format, index=index),
+                           file_name=f'{name}.{format}', key=key+"download")
+
+
+def _group_value(value):
+    # text typed in the editor -> int, float or text
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def remap_editor(df, source, key='remap'):
+    """
+    Create or change a stored code -> group table that derives a new column from source.
+    """
+    if not source:
+        st.write('Select a column to group by first.')
+        return
+
+    remaps = remap.load_remaps()
+    name = st.text_input('New column name:', key=key+"name")
+    existing = remaps.get(name) if remaps.get(name, {}).get('source') == source else None
+    current = dict(map(tuple, existing['mapping'])) if existing else {}
+
+    codes = pd.Series(pd.unique(df[source].dropna())).sort_values().head(1000)
+    table = pd.DataFrame({'Code': codes.to_numpy(), 'Group': [str(current[code]) if code in current else None for code in codes]})
+    table = st.data_editor(table, disabled=['Code'], hide_index=True, key=key+name+"table")
+    default = st.text_input('Group for other codes (empty leaves them empty):',
+                            value='' if not existing or existing.get('default') is None else str(existing['default']),
+                            key=key+name+"default")
+
+    if st.button('Save grouping', key=key+"save", disabled=not name):
+        mapping = [(code, _group_value(group)) for code, group in zip(table['Code'], table['Group']) if group not in (None, '')]
+        remap.save_remap(name, source, mapping, default=_group_value(default) if default != '' else None,
+                         description=f'{source} is grouped into {name} column')
+        st.success(f"Grouping '{name}' saved.")
+        st.rerun()
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from . import resultcache
+
+# Sort orders as row permutations instead of sorted copies. A permutation is an int64
+# array, so it is cheap to cache per dataset and sort key, and a sorted view of the
+# frame is read through it one page at a time without materialising the whole frame.
+
+PAGE_ROWS = 1000
+
+
+def _key(values, ascending):
+    # sort key of one column: the numbers themselves or ranks of the values, missing values after all others
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        if pd.api.types.is_signed_integer_dtype(values) and not values.hasnans:
+            # exact for integers beyond float precision
+            numbers = values.to_numpy(dtype=np.int64)
+        else:
+            numbers = values.to_numpy(dtype=float, na_value=np.nan)
+        if ascending:
+            return numbers
+        # negated, NaN stays NaN and still sorts last
+        return -numbers
+    codes, uniques = pd.factorize(values, sort=True)
+    codes = codes.astype(np.int64)
+    if not ascending:
+        codes = np.where(codes >= 0, len(uniques) - 1 - codes, codes)
+    codes[codes < 0] = len(uniques)
+    return codes
+
+
+def sort_order(df, columns, ascending=True):
+    """
+    Stable permutation sorting df by columns, the row order of
+    df.sort_values(columns, ascending=ascending, kind='stable') with missing values last.
+
+    Parameters:
+    - columns: column name or list of column names, the first one the primary key.
+    - ascending: bool, or one bool per column.
+
+    Returns positions into df (use with iloc or take).
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    ascending = [ascending] * len(columns) if isinstance(ascending, bool) else list(ascending)
+    if len(ascending) != len(columns):
+        raise ValueError('ascending must be a bool or have one entry per column')
+    if not columns:
+        return np.arange(len(df))
+    if len(columns) == 1:
+        return np.argsort(_key(df[columns[0]], ascending[0]), kind='stable')
+    # lexsort sorts by the last key first
+    return np.lexsort([_key(df[column], up) for column, up in zip(columns, ascending)][::-1])
+
+
+def cached_order(df, columns, ascending=True):
+    # sort_order through the shared result cache, keyed by the sort columns' content and direction
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    return resultcache.cached_call(sort_order, df, columns, columns=columns, ascending=ascending)
+
+
+def take_sorted(df, order, start=0, stop=None):
+    # rows start:stop of df in the order of the permutation, the only rows copied
+    return df.iloc[order[start:stop]]
+
+
+def pages(order, page_rows=PAGE_ROWS):
+    return max(1, -(-len(order) // page_rows))
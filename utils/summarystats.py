@@ -0,0 +1,248 @@
+import numpy as np
+import pandas as pd
+
+# Summary statistics in one pass per column, replacing DataFrame.describe(). Every column
+# gets a small accumulator that is updated chunk by chunk and can be merged with another,
+# so files are summarized without loading them whole and without sorting any column:
+# percentiles come from a histogram on a power-of-two grid instead of a sort.
+
+# upper bound on histogram bins kept per column; the bin width doubles when it is exceeded
+MAX_BINS = 2048
+
+# distinct values are counted exactly up to this many, and estimated from the smallest hashes above it
+DISTINCT_SKETCH_SIZE = 4096
+
+SUMMARY_QUANTILES = (0.25, 0.5, 0.75)
+
+_HASH_RANGE = float(2 ** 64)
+
+
+class ColumnSummary:
+    """
+    Mergeable one-pass accumulator for one column: count, nulls, distinct count, mean, std,
+    min, max and a histogram.
+
+    Mean and variance are merged with Chan's parallel formula. The histogram counts values in
+    bins of width 2**k; bins are stored as an offset and a count array and merged pairwise when
+    the column needs more than MAX_BINS of them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.numeric = True
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.nan
+        self.max = np.nan
+        self.exponent = None
+        self.offset = 0
+        self.bins = np.zeros(0, dtype=np.int64)
+        # -inf and +inf values are counted apart from the histogram
+        self.infinite = np.zeros(2, dtype=np.int64)
+        self.hashes = np.zeros(0, dtype=np.uint64)
+
+    def update(self, values):
+        values = pd.Series(values)
+        missing = values.isna().to_numpy()
+        self.nulls += int(missing.sum())
+        present = values[~missing]
+
+        if not pd.api.types.is_numeric_dtype(present) or pd.api.types.is_bool_dtype(present):
+            self._update_distinct(pd.util.hash_array(present.to_numpy()))
+            self.count += len(present)
+            self.numeric = False
+            return self
+
+        # hashed as floats, so 1 and 1.0 in chunks of different dtypes are the same value
+        numbers = present.to_numpy(dtype=float)
+        self._update_distinct(pd.util.hash_array(numbers))
+        # infinite values make the mean infinite and the std NaN, as in describe()
+        with np.errstate(invalid='ignore'):
+            self._merge_moments(*_moments(numbers))
+        finite = np.isfinite(numbers)
+        self.infinite += [int((numbers[~finite] < 0).sum()), int((numbers[~finite] > 0).sum())]
+        if finite.any():
+            self._merge_histogram(*_histogram(numbers[finite], self.exponent))
+        return self
+
+    def merge(self, other):
+        # combine with the summary of another part of the same column
+        self.nulls += other.nulls
+        self._update_distinct(other.hashes)
+        if not (self.numeric and other.numeric):
+            self.count += other.count
+            self.numeric = False
+            return self
+        self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+        self.infinite = self.infinite + other.infinite
+        if other.exponent is not None:
+            self._merge_histogram(other.exponent, other.offset, other.bins)
+        return self
+
+    def _merge_moments(self, count, mean, m2, low, high):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = np.fmin(self.min, low)
+        self.max = np.fmax(self.max, high)
+
+    def _merge_histogram(self, exponent, offset, bins):
+        if self.exponent is None:
+            self.exponent, self.offset, self.bins = exponent, offset, bins
+            return
+        # bring both histograms to the coarser grid, then to at most MAX_BINS bins
+        target = max(self.exponent, exponent)
+        a = _coarsen(self.offset, self.bins, target - self.exponent)
+        b = _coarsen(offset, bins, target - exponent)
+        low = min(a[0], b[0])
+        high = max(a[0] + len(a[1]), b[0] + len(b[1]))
+        while high - low > MAX_BINS:
+            a, b = _coarsen(*a, 1), _coarsen(*b, 1)
+            target += 1
+            low = min(a[0], b[0])
+            high = max(a[0] + len(a[1]), b[0] + len(b[1]))
+        merged = np.zeros(high - low, dtype=np.int64)
+        merged[a[0] - low:a[0] - low + len(a[1])] += a[1]
+        merged[b[0] - low:b[0] - low + len(b[1])] += b[1]
+        self.exponent, self.offset, self.bins = target, low, merged
+
+    def _update_distinct(self, hashes):
+        # keep the DISTINCT_SKETCH_SIZE smallest distinct hashes (a k-minimum-values sketch)
+        hashes = pd.unique(np.concatenate([self.hashes, hashes]))
+        if len(hashes) > DISTINCT_SKETCH_SIZE:
+            hashes = np.partition(hashes, DISTINCT_SKETCH_SIZE - 1)[:DISTINCT_SKETCH_SIZE]
+        self.hashes = hashes
+
+    def distinct(self):
+        # exact below the sketch size, estimated from the largest kept hash above it
+        if len(self.hashes) < DISTINCT_SKETCH_SIZE:
+            return len(self.hashes)
+        return int(round((DISTINCT_SKETCH_SIZE - 1) / ((float(self.hashes.max()) + 1) / _HASH_RANGE)))
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def bin_width(self):
+        return 2.0 ** self.exponent if self.exponent is not None else np.nan
+
+    def _order_statistic(self, cumulative, k):
+        # the k-th smallest value (from 0), placed by rank inside its histogram bin: off by less than the bin width
+        if k < self.infinite[0]:
+            return -np.inf
+        k -= self.infinite[0]
+        if k >= cumulative[-1]:
+            return np.inf
+        position = int(np.searchsorted(cumulative, k, side='right'))
+        below = cumulative[position] - self.bins[position]
+        value = (self.offset + position + (k - below + 0.5) / self.bins[position]) * self.bin_width()
+        return float(np.clip(value, self.min, self.max))
+
+    def quantile(self, q):
+        # linear interpolation between the order statistics around rank q * (count - 1), like
+        # Series.quantile; each of them is read from the histogram
+        if self.exponent is None and not self.infinite.any():
+            return np.nan
+        cumulative = np.cumsum(self.bins) if len(self.bins) else np.zeros(1, dtype=np.int64)
+
+        def value(k):
+            # the smallest and largest values are known exactly
+            if k == 0:
+                return self.min
+            if k == self.count - 1:
+                return self.max
+            return self._order_statistic(cumulative, k)
+
+        rank = q * (self.count - 1)
+        k = int(np.floor(rank))
+        low = value(k)
+        if rank == k:
+            return float(low)
+        high = value(k + 1)
+        # equal values, infinite ones included, need no interpolation; between -inf and inf it is NaN
+        with np.errstate(invalid='ignore'):
+            return float(low if high == low else low + (rank - k) * (high - low))
+
+    def histogram(self):
+        # Series of counts indexed by the left edge of each bin
+        edges = (self.offset + np.arange(len(self.bins))) * self.bin_width()
+        return pd.Series(self.bins, index=pd.Index(edges, name='Bin'), name='Count')
+
+
+def _moments(values):
+    # count, mean, sum of squared deviations, min and max of a chunk
+    if len(values) == 0:
+        return 0, 0.0, 0.0, np.nan, np.nan
+    mean = values.mean()
+    return len(values), mean, float(((values - mean) ** 2).sum()), values.min(), values.max()
+
+
+def _histogram(values, exponent=None):
+    # counts on the grid of width 2**exponent, chosen from the chunk range when not given
+    low, high = values.min(), values.max()
+    if exponent is None:
+        span = high - low
+        if span > 0:
+            exponent = int(np.ceil(np.log2(span / (MAX_BINS - 1))))
+        else:
+            # a single value: any grid works, take one of about unit scale
+            exponent = int(np.floor(np.log2(abs(low)))) - 10 if low != 0 else 0
+    while np.floor(high / 2.0 ** exponent) - np.floor(low / 2.0 ** exponent) >= MAX_BINS:
+        exponent += 1
+    index = np.floor(values / 2.0 ** exponent).astype(np.int64)
+    offset = int(index.min())
+    return exponent, offset, np.bincount(index - offset)
+
+
+def _coarsen(offset, bins, steps):
+    # merge pairs of bins steps times: bin i of width w becomes bin floor(i / 2) of width 2w
+    for _ in range(steps):
+        index = (offset + np.arange(len(bins))) // 2
+        new_offset = int(index[0]) if len(bins) else offset // 2
+        bins = np.bincount(index - new_offset, weights=bins).astype(np.int64) if len(bins) else bins
+        offset = new_offset
+    return offset, bins
+
+
+def summarize(chunks):
+    """
+    Summarize a DataFrame, or an iterable of DataFrame chunks of the same file, in one pass.
+
+    Returns a dict column -> ColumnSummary.
+    """
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    summaries = {}
+    for chunk in chunks:
+        for column in chunk.columns:
+            summaries.setdefault(column, ColumnSummary()).update(chunk[column])
+    return summaries
+
+
+def summary_table(summaries, quantiles=SUMMARY_QUANTILES):
+    """
+    describe()-like table, one column per data column: count, nulls, distinct, mean, std, min,
+    percentiles, max, and the histogram bin width that bounds the percentile error.
+    """
+    rows = {}
+    for column, summary in summaries.items():
+        numeric = summary.numeric and summary.count > 0
+        stats = {'count': summary.count, 'nulls': summary.nulls, 'distinct': summary.distinct()}
+        stats['mean'] = summary.mean if numeric else np.nan
+        stats['std'] = summary.std() if numeric else np.nan
+        stats['min'] = summary.min if numeric else np.nan
+        for q in quantiles:
+            stats[f'{q * 100:g}%'] = summary.quantile(q) if numeric else np.nan
+        stats['max'] = summary.max if numeric else np.nan
+        stats['bin width'] = summary.bin_width() if numeric else np.nan
+        rows[column] = stats
+    return pd.DataFrame(rows)
+
+
+def summarize_csv(source, chunksize=100_000, **read_csv_args):
+    # summary of a csv file read chunk by chunk, so it never has to fit in memory
+    return summarize(pd.read_csv(source, chunksize=chunksize, **read_csv_args))
@@ -0,0 +1,312 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import pandas as pd
+from . import batch, export, sharedframe
+
+# Work queue on a shared directory for spreading batch peaks over processes and machines.
+# A coordinator writes one work unit (file × window × grouping) per json file; workers
+# on any host with the same mount claim units by renaming them, which only one worker
+# can win, and hold them under a lease kept alive by touching the claimed file. Units
+# whose lease expired are put back for another worker, up to a number of attempts.
+# Partial results are written per unit and combined by merge().
+#
+# queue layout:
+#   pending/<unit>.json   units waiting for a worker
+#   claimed/<unit>.json   units being worked on, lease = mtime + lease seconds
+#   done/<unit>.json      finished units
+#   failed/<unit>.json    units that failed max_attempts times, with the last error
+#   results/<unit>.pkl    partial results of finished units
+
+STATES = ('pending', 'claimed', 'done', 'failed')
+
+# seconds a claim stays valid without being renewed
+LEASE_SECONDS = 300
+
+MAX_ATTEMPTS = 3
+
+
+def _path(queue, state, unit_id, extension='.json'):
+    return os.path.join(queue, state, unit_id + extension)
+
+
+def _read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write(path, content):
+    # write then rename, so readers never see a partial file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(content, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _units(queue, state):
+    folder = os.path.join(queue, state)
+    return sorted(name[:-5] for name in os.listdir(folder) if name.endswith('.json'))
+
+
+def worker_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def create_queue(queue, folder, windows=(60,), groupings=('PaxSPorPE',), show_in_hhmm_format=True):
+    """
+    Write one work unit per replication file, window and grouping of a scenario folder.
+
+    File paths are stored as absolute paths, so the scenario folder must be mounted at the
+    same path on every worker host.
+
+    Returns the number of units written.
+    """
+    for state in STATES + ('results',):
+        os.makedirs(os.path.join(queue, state), exist_ok=True)
+
+    count = 0
+    for file in batch.scenario_files(folder):
+        for window in windows:
+            for groupBy in groupings:
+                unit_id = f'{os.path.splitext(file)[0]}-w{window}-{groupBy}'
+                unit = {'id': unit_id, 'file': os.path.abspath(os.path.join(folder, file)), 'window': window, 'groupBy': groupBy,
+                        'hhmm': show_in_hhmm_format, 'attempts': 0}
+                _write(_path(queue, 'pending', unit_id), unit)
+                count += 1
+    return count
+
+
+def status(queue):
+    # number of units in every state
+    return {state: len(_units(queue, state)) for state in STATES}
+
+
+def claim(queue, worker=None):
+    """
+    Claim the next pending unit for worker. Returns the unit, or None when nothing is pending.
+    """
+    for unit_id in _units(queue, 'pending'):
+        try:
+            # the rename keeps the mtime, so start the lease before the unit shows up in claimed/
+            os.utime(_path(queue, 'pending', unit_id))
+            # the rename is atomic: exactly one worker moves the file
+            os.rename(_path(queue, 'pending', unit_id), _path(queue, 'claimed', unit_id))
+        except FileNotFoundError:
+            continue
+        try:
+            unit = _read(_path(queue, 'claimed', unit_id))
+            unit['worker'] = worker or worker_name()
+            _write(_path(queue, 'claimed', unit_id), unit)
+        except FileNotFoundError:
+            # requeued by another worker in the meantime, it is theirs now
+            continue
+        return unit
+    return None
+
+
+def renew(queue, unit):
+    # extend the lease of a claimed unit
+    os.utime(_path(queue, 'claimed', unit['id']))
+
+
+def _release(queue, unit_id, error=None, max_attempts=MAX_ATTEMPTS):
+    # move a claimed unit back to pending, or to failed after max_attempts, counting the attempt
+    staging = _path(queue, 'claimed', unit_id, f'.{worker_name()}.release')
+    try:
+        # a private name first, so only one worker handles the unit
+        os.rename(_path(queue, 'claimed', unit_id), staging)
+    except FileNotFoundError:
+        return
+    unit = _read(staging)
+    unit['attempts'] += 1
+    unit.pop('worker', None)
+    if error is not None:
+        unit['error'] = error
+    state = 'failed' if unit['attempts'] >= max_attempts else 'pending'
+    _write(_path(queue, state, unit_id), unit)
+    os.remove(staging)
+
+
+def requeue_expired(queue, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """
+    Put back units whose lease expired, e.g. because their worker died. Returns their ids.
+    """
+    now = time.time()
+    expired = []
+    for unit_id in _units(queue, 'claimed'):
+        try:
+            if os.path.getmtime(_path(queue, 'claimed', unit_id)) + lease < now:
+                _release(queue, unit_id, error='lease expired', max_attempts=max_attempts)
+                expired.append(unit_id)
+        except FileNotFoundError:
+            # finished or requeued meanwhile
+            continue
+    return expired
+
+
+def process(unit, frames=None):
+    """
+    Compute the partial result of one unit.
+
+    With frames (a dict filled by the worker), replication files are read through shared frames:
+    the first worker on a machine parses a file and the others attach to it, so the units of all
+    windows and groupings of a file share one parsed copy.
+    """
+    df = None
+    if frames is not None:
+        path = unit['file']
+        if path not in frames:
+            stat = os.stat(path)
+            name = sharedframe.frame_name(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+            frames[path] = (name,) + sharedframe.shared_frame(name, lambda: batch.read_passengers(path))
+        df = frames[path][1]
+    return batch.file_peaks(unit['file'], window=unit['window'], show_in_hhmm_format=unit['hhmm'], groupBy=unit['groupBy'], df=df)
+
+
+def complete(queue, unit, result):
+    # store the partial result, then mark the unit done
+    path = _path(queue, 'results', unit['id'], '.pkl')
+    pd.to_pickle(result, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    try:
+        os.rename(_path(queue, 'claimed', unit['id']), _path(queue, 'done', unit['id']))
+    except FileNotFoundError:
+        # the lease expired and the unit was requeued; the result is the same, so it stays
+        pass
+
+
+def run_worker(queue, worker=None, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, poll=1.0, wait=False, share=False):
+    """
+    Claim and process units until the queue is drained.
+
+    Parameters:
+    - worker: worker name (default: host and process id).
+    - lease: lease length in seconds; the lease is renewed while a unit is processed.
+    - poll: seconds to wait when no unit is pending but others are still claimed.
+    - wait: keep polling for new units when the queue is empty instead of returning.
+    - share: share parsed replication files with the other workers on this machine.
+
+    Returns the number of units this worker completed.
+    """
+    frames = {} if share else None
+    try:
+        return _work(queue, worker or worker_name(), lease, max_attempts, poll, wait, frames)
+    finally:
+        for name, _, token in (frames or {}).values():
+            sharedframe.release(name, token)
+
+
+def _work(queue, worker, lease, max_attempts, poll, wait, frames):
+    completed = 0
+    while True:
+        requeue_expired(queue, lease, max_attempts)
+        unit = claim(queue, worker)
+        if unit is None:
+            # units claimed by others may still come back when their lease expires
+            if not wait and not _units(queue, 'claimed'):
+                return completed
+            time.sleep(poll)
+            continue
+
+        # renew the lease in the background while the unit is processed
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(queue, unit, lease / 3, stop), daemon=True)
+        heartbeat.start()
+        error = None
+        try:
+            result = process(unit, frames)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        if error is not None:
+            _release(queue, unit['id'], error=error, max_attempts=max_attempts)
+            continue
+        complete(queue, unit, result)
+        completed += 1
+
+
+def _heartbeat(queue, unit, interval, stop):
+    while not stop.wait(interval):
+        try:
+            renew(queue, unit)
+        except FileNotFoundError:
+            return
+
+
+def run_local(queue, workers=None, **worker_args):
+    # run several workers as local processes, e.g. to use every core of one machine
+    workers = workers or os.cpu_count() or 1
+    processes = [multiprocessing.Process(target=run_worker, args=(queue, f'{worker_name()}-{i}'), kwargs=worker_args)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    if worker_args.get('share'):
+        # frames of workers that were killed before releasing them
+        sharedframe.cleanup()
+
+
+def merge(queue):
+    """
+    Combine the partial results of all finished units.
+
+    Returns a dict (window, groupBy) -> (peaks, peaks_grouped, sscp_perc) as from batch.get_peaks.
+    """
+    results = {}
+    for unit_id in _units(queue, 'done'):
+        unit = _read(_path(queue, 'done', unit_id))
+        file = os.path.basename(unit['file'])
+        results.setdefault((unit['window'], unit['groupBy']), {})[file] = pd.read_pickle(_path(queue, 'results', unit_id, '.pkl'))
+    return {key: batch.combine_peaks(dict(sorted(files.items()))) for key, files in sorted(results.items())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch peaks through a work queue on a shared directory.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help='write the work units of a scenario folder')
+    create.add_argument('queue', help='queue directory')
+    create.add_argument('folder', help='folder with the replication csv files')
+    create.add_argument('--window', type=int, nargs='+', default=[60], help='rolling windows in minutes')
+    create.add_argument('--group', nargs='+', default=['PaxSPorPE'], help='columns to group the peaks by')
+    create.add_argument('--hhmm', action='store_true', help='report peak times in HH:MM format')
+
+    work = commands.add_parser('work', help='process units until the queue is drained')
+    work.add_argument('queue', help='queue directory')
+    work.add_argument('--workers', type=int, default=1, help='number of local worker processes')
+    work.add_argument('--lease', type=float, default=LEASE_SECONDS, help='lease length in seconds')
+    work.add_argument('--attempts', type=int, default=MAX_ATTEMPTS, help='attempts before a unit fails')
+    work.add_argument('--wait', action='store_true', help='keep waiting for new units')
+    work.add_argument('--share', action='store_true', help='parse each replication file once per machine and share it')
+
+    show = commands.add_parser('status', help='count units in every state')
+    show.add_argument('queue', help='queue directory')
+
+    combine = commands.add_parser('merge', help='combine partial results into reports')
+    combine.add_argument('queue', help='queue directory')
+    combine.add_argument('--out', default='reports', help='output folder, one subfolder per window and grouping')
+    combine.add_argument('--format', choices=export.FORMATS, default='csv', help='output format')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        print(create_queue(args.queue, args.folder, args.window, args.group, args.hhmm), 'units')
+    elif args.command == 'work':
+        run_local(args.queue, args.workers, lease=args.lease, max_attempts=args.attempts, wait=args.wait, share=args.share)
+    elif args.command == 'status':
+        print(status(args.queue))
+    else:
+        for (window, groupBy), result in merge(args.queue).items():
+            folder = os.path.join(args.out, f'w{window}-{groupBy}')
+            for path in export.export_report(batch.scenario_report(*result, groupBy=groupBy), folder, format=args.format):
+                print(path)
+
+
+if __name__ == '__main__':
+    main()